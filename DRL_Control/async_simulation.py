@@ -0,0 +1,121 @@
+import threading
+import timeit
+
+from training_simulation import Simulation
+from numpy_model import NumpyModel
+
+
+class AsyncSimulation:
+    def __init__(self, Model, Memory, Environment, gamma, max_steps, green_duration, yellow_duration, num_states, num_actions, training_epochs, sync_interval, TrafficGen=None):
+        self._Model = Model
+        self._training_epochs = training_epochs
+        self._sync_interval = sync_interval
+        # the actor acts with a numpy copy of the weights, so that it never waits for the training thread
+        self._Policy = NumpyModel(num_states, [])
+        self._Policy.set_weights(Model.get_weights())
+        self._Simulation = Simulation(Model, Memory, Environment, gamma, max_steps, green_duration, yellow_duration, num_states, num_actions, training_epochs, Policy=self._Policy, TrafficGen=TrafficGen)
+        self._overlap_ratio_store = []
+
+        self._condition = threading.Condition()
+        self._pending_replays = 0  # replays requested to the learner and not done yet
+        self._simulating = False
+        self._stop = False
+        self._training_time = 0
+        self._learner = threading.Thread(target=self._learn, name='learner', daemon=True)
+        self._learner.start()
+
+
+    def run(self, episode, epsilon):
+        """
+        Runs an episode of simulation while the learner thread trains from the memory, then waits for the learner to finish its replays
+        """
+        start_time = timeit.default_timer()
+        with self._condition:
+            self._pending_replays += self._training_epochs
+            self._simulating = True
+            self._training_time = 0
+            self._condition.notify_all()
+
+        simulation_time = self._Simulation.run_simulation(episode, epsilon)
+
+        print("Training...")
+        with self._condition:
+            self._simulating = False
+            self._condition.notify_all()
+            while self._pending_replays > 0:
+                self._condition.wait()
+            training_time = round(self._training_time, 1)
+        self._Simulation.store_training_instrumentation()  # the replays that ran during the simulation are in the measures of the episode
+        total_time = timeit.default_timer() - start_time
+
+        # share of the training time that ran while the simulation was running
+        overlap_ratio = max(0.0, (simulation_time + training_time - total_time) / training_time) if training_time > 0 else 0.0
+        self._overlap_ratio_store.append(overlap_ratio)
+
+        return simulation_time, training_time
+
+
+    def _learn(self):
+        """
+        Learner thread: do the requested replays as soon as the memory is full enough, syncing the actor weights periodically
+        """
+        updates = 0
+        while True:
+            with self._condition:
+                while self._pending_replays == 0 and not self._stop:
+                    self._condition.wait()
+                if self._stop:
+                    return
+
+            start_time = timeit.default_timer()
+            trained = self._Simulation._replay()
+            if trained:
+                updates += 1
+                if updates % self._sync_interval == 0:
+                    self._Policy.set_weights(self._Model.get_weights())
+
+            with self._condition:
+                self._training_time += timeit.default_timer() - start_time
+                if trained or not self._simulating:
+                    # like the sequential training, the replays of an episode ending with a memory not full enough are skipped
+                    self._pending_replays -= 1
+                else:
+                    self._condition.wait(0.05)  # wait for the simulation to add samples
+                if self._pending_replays == 0:
+                    self._Policy.set_weights(self._Model.get_weights())
+                    self._condition.notify_all()
+
+
+    def close(self):
+        """
+        Stop the learner thread
+        """
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        self._learner.join()
+
+
+    @property
+    def reward_store(self):
+        return self._Simulation.reward_store
+
+
+    @property
+    def cumulative_wait_store(self):
+        return self._Simulation.cumulative_wait_store
+
+
+    @property
+    def avg_queue_length_store(self):
+        return self._Simulation.avg_queue_length_store
+
+
+    @property
+    def instrumentation_store(self):
+        return self._Simulation.instrumentation_store
+
+
+    @property
+    def overlap_ratio_store(self):
+        return self._overlap_ratio_store
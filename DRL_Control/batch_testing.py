@@ -0,0 +1,176 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+import csv
+import random
+import argparse
+import functools
+import itertools
+import tempfile
+import multiprocessing
+import numpy as np
+
+from testing_simulation import Simulation
+from generator import generate_routes, route_options
+from sumo_backend import traci, use_backend
+from tflite_model import PRECISIONS
+from utils import import_test_configuration
+
+
+RESULT_FIELDS = ['model', 'seed', 'scenario', 'total_reward', 'avg_queue_length', 'total_waiting_time', 'simulation_time', 'error']
+# the models folder and the sumocfg are found from the repository, whatever the working directory
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+NETWORK_DIR = os.path.join(REPO_DIR, 'Network')
+
+# configuration and models of the worker process, set by _init_worker
+_worker_config = None
+_worker_model_class = None
+_worker_models = {}
+
+
+def _init_worker(config, inference_backend):
+    """
+    Select the sumo backend and the model class of a worker process
+    """
+    global _worker_config, _worker_model_class
+    use_backend(config['sumo_backend'])
+    _worker_config = config
+    if inference_backend == 'numpy':
+        from numpy_model import NumpyTestModel as TestModel  # dense network evaluated in numpy, tensorflow is never imported
+    elif inference_backend == 'tflite':
+        from tflite_model import TFLiteTestModel  # quantized export of the network, run by a TFLite interpreter
+        TestModel = functools.partial(TFLiteTestModel, precision=config['inference_precision'])
+    else:
+        from model import TestModel
+    _worker_model_class = TestModel
+
+
+def _get_model(model_path):
+    """
+    Load a model once per worker process, the following jobs of the same model reuse it
+    """
+    if model_path not in _worker_models:
+        _worker_models[model_path] = _worker_model_class(input_dim=_worker_config['num_states'], model_path=model_path)
+    return _worker_models[model_path]
+
+
+def _run_job(model_n, model_path, seed, scenario):
+    """
+    Run one test episode of a model with its own sumo instance. The scenario is 'fixed' for the route files of the sumocfg,
+    or the scale of a demand generated with the seed
+    """
+    config = _worker_config
+    sumo_cmd = ['sumo', '-c', os.path.join(NETWORK_DIR, config['sumocfg_file_name']), '--no-step-log', 'true', '--waiting-time-memory', str(config['max_steps'])]
+    random.seed(seed)  # the testing simulation samples the cars and pedestrians that are seen
+
+    with tempfile.TemporaryDirectory() as route_folder:
+        if scenario != 'fixed':
+            sumo_cmd = sumo_cmd + route_options(*generate_routes(route_folder, seed, float(scenario)))
+
+        Episode = Simulation(
+            _get_model(model_path),
+            sumo_cmd,
+            config['max_steps'],
+            config['green_duration'],
+            config['yellow_duration'],
+            config['num_states'],
+            config['num_actions']
+        )
+        try:
+            simulation_time, total_waiting_time = Episode.run(seed)
+        finally:
+            if traci.isLoaded():  # an episode that failed leaves its sumo connected, the next job of the worker starts its own
+                traci.close()
+
+    return {
+        'model': model_n,
+        'seed': seed,
+        'scenario': scenario,
+        'total_reward': float(np.sum(Episode.reward_episode)),
+        'avg_queue_length': float(np.mean(Episode.queue_length_episode)),
+        'total_waiting_time': total_waiting_time,
+        'simulation_time': simulation_time,
+    }
+
+
+def _run_job_args(job):
+    """
+    Run a job, turning a failure into a result row with the error. The model loaders exit on a missing model,
+    the SystemExit would otherwise kill the worker and its result would never arrive. A KeyboardInterrupt still stops the batch
+    """
+    try:
+        return _run_job(*job)
+    except (Exception, SystemExit) as error:
+        model_n, _, seed, scenario = job
+        return {'model': model_n, 'seed': seed, 'scenario': scenario, 'error': type(error).__name__ + ': ' + str(error)}
+
+
+def run_batch(config, models, seeds, scenarios, num_workers, inference_backend='numpy'):
+    """
+    Run every (model, seed, scenario) job on a pool of worker processes, returning the results in the order of the jobs
+    """
+    models_path = os.path.join(REPO_DIR, config['models_path_name'])
+    for model_n in models:
+        if not os.path.isdir(os.path.join(models_path, 'model_' + str(model_n))):
+            sys.exit("Model number not found: " + str(model_n) + " in " + os.path.abspath(models_path))
+    jobs = [(model_n, os.path.join(models_path, 'model_' + str(model_n), ''), seed, scenario)
+            for model_n, seed, scenario in itertools.product(models, seeds, scenarios)]
+    print("Running", len(jobs), "test episodes on", num_workers, "workers...")
+
+    results = []
+    with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(config, inference_backend)) as pool:
+        for result in pool.imap(_run_job_args, jobs):
+            if 'error' in result:
+                print('Model', result['model'], '- seed', result['seed'], '- scenario', result['scenario'], '- failed:', result['error'])
+                results.append(result)
+                continue
+            print('Model', result['model'], '- seed', result['seed'], '- scenario', result['scenario'],
+                  '- reward:', result['total_reward'], '- average queue:', round(result['avg_queue_length'], 2))
+            results.append(result)
+    return results
+
+
+def save_results(results, output_file):
+    """
+    Write the results table as csv, one row per test episode
+    """
+    with open(output_file, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def print_summary(results):
+    """
+    Print the mean reward and queue length of every model over its seeds and scenarios, the failed episodes left out
+    """
+    print("\n----- Model, mean reward, mean queue length, episodes")
+    results = [result for result in results if 'error' not in result]
+    for model_n, model_results in itertools.groupby(sorted(results, key=lambda result: result['model']), key=lambda result: result['model']):
+        model_results = list(model_results)
+        print(model_n, np.mean([result['total_reward'] for result in model_results]),
+              np.mean([result['avg_queue_length'] for result in model_results]), len(model_results))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Evaluate several models over several seeds and demand scenarios in parallel")
+    parser.add_argument('--config', default='testing_settings.ini', help="testing settings, for the simulation and the models folder")
+    parser.add_argument('--models', type=int, nargs='+', required=True, help="numbers of the models to test, e.g. 16 17 20")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[10000], help="seeds of the episodes, of the demand and of the sampling of the state")
+    parser.add_argument('--scenarios', nargs='+', default=['fixed'], help="'fixed' for the route files of the sumocfg, or demand scales such as 0.8 1.0 1.2")
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help="number of sumo instances running at the same time")
+    parser.add_argument('--inference-backend', choices=('numpy', 'keras', 'tflite'), default='numpy')
+    parser.add_argument('--precision', choices=PRECISIONS, help="weights of the tflite model, inference_precision of the config by default")
+    parser.add_argument('--output', default='batch_results.csv', help="csv file of the results table")
+    args = parser.parse_args()
+
+    config = import_test_configuration(config_file=args.config)
+    if args.precision is not None:
+        config['inference_precision'] = args.precision
+    results = run_batch(config, args.models, args.seeds, args.scenarios, args.workers, args.inference_backend)
+    save_results(results, args.output)
+    print_summary(results)
+    print("----- Results saved at:", args.output)
@@ -0,0 +1,708 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os
+import sys
+import json
+import random
+import timeit
+import argparse
+import platform
+import datetime
+import subprocess
+import tempfile
+import tracemalloc
+import numpy as np
+
+from memory import Memory, PrioritizedMemory
+from state_encoder import StateEncoder, LaneCellEncoder, EDGE_CELLS, MOVEMENTS, PEDESTRIAN_GROUPS
+from utils import import_train_configuration
+from sumo_backend import traci, use_backend, BACKENDS, TRACE_BACKENDS
+from subscriptions import VehicleSubscriptions
+from training_simulation import Simulation
+from environment import SumoEnvironment
+from traci import constants as tc
+
+
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class ListMemory:
+    """
+    The previous list-of-tuples replay memory, kept as the reference for the benchmarks
+    """
+    def __init__(self, size_max, size_min):
+        self._samples = []
+        self._size_max = size_max
+        self._size_min = size_min
+
+
+    def add_sample(self, sample):
+        self._samples.append(sample)
+        if len(self._samples) > self._size_max:
+            self._samples.pop(0)
+
+
+    def get_samples(self, n):
+        if len(self._samples) < self._size_min:
+            return []
+        return random.sample(self._samples, min(n, len(self._samples)))
+
+
+def legacy_encode(vehicles, pedestrian_ids, num_states):
+    """
+    The previous if/elif state encoding of Simulation._get_state, kept as the reference for the benchmarks
+    """
+    state = np.zeros(num_states)
+    c2 = c3 = c14 = 0
+    for pedestrian_id in pedestrian_ids:
+        movement = pedestrian_id.split('_')[0]
+        if movement == 'pedestrian1' or movement == 'pedestrian3':
+            c14 += 1
+        elif movement == 'pedestrian2' or movement == 'pedestrian4':
+            c2 += 1
+        elif movement == 'pedestrian5' or movement == 'pedestrian6':
+            c3 += 1
+
+    sdic = {}
+    movement_number = None
+    for car_id, edge_name, lane_pos in vehicles:
+        if edge_name == '1120094388#0':
+            lane_cell = 0
+        elif edge_name == '1120094388#1':
+            lane_cell = 1
+        elif edge_name == '130285156#1':
+            lane_cell = 2
+        elif edge_name == '130285156#2':
+            lane_cell = 3
+        elif edge_name == '50799230#0':
+            lane_cell = 1 if lane_pos < 62.5 else 2 if lane_pos < 135 else 3
+        elif edge_name == '50799230#3':
+            lane_cell = 3 if lane_pos < 9 else 4
+        elif edge_name == '-590598876#1':
+            lane_cell = 1 if lane_pos < 25 else 2 if lane_pos < 50 else 3 if lane_pos < 75 else 4
+        else:
+            lane_cell = 101
+        # like the if/elif chain, a vehicle outside the generated trips (the metro) keeps the previous movement
+        movement_number = {'veh1': 1, 'veh98': 2, 'veh0': 3, 'veh55': 4, 'veh51': 5, 'veh60': 6}.get(car_id.split('_')[0], movement_number)
+        if lane_cell != 101:
+            id = (lane_cell - 1) * 6 + (movement_number - 1)
+            if id not in sdic.keys():
+                sdic[id] = 0
+            sdic[id] += 1
+    sdic[24] = c2
+    sdic[25] = c3
+    sdic[26] = c14
+    for id in sdic.keys():
+        total = sum(sdic.values())
+        if total == 0:
+            total = 1
+        state[id] = sdic[id] / total
+    return state, c14, c2, c3
+
+
+def _random_intersection(num_cars, num_pedestrians):
+    """
+    Generate car records and pedestrian ids spread over the incoming edges and movements of the intersection
+    """
+    edges = list(EDGE_CELLS) + ['-130285156#2', ':cluster_49793670_9123357154_9123357155_9428447085_0']
+    vehicles = [(random.choice(list(MOVEMENTS)) + '_' + str(i), random.choice(edges), random.uniform(0, 200)) for i in range(num_cars)]
+    pedestrian_ids = [random.choice(list(PEDESTRIAN_GROUPS) + ['ped1']) + '_' + str(i) for i in range(num_pedestrians)]
+    return vehicles, pedestrian_ids
+
+
+def bench_state_encoder(num_states=27, num_cars=60, num_pedestrians=40, states=5000, recorded=()):
+    """
+    Check that the state encoder matches the previous encoding, on random intersections and on the recorded ones,
+    and compare their encoding rate
+    """
+    StateEncoderModel = StateEncoder(num_states)
+    intersections = [_random_intersection(random.randint(0, num_cars), random.randint(0, num_pedestrians)) for _ in range(states)]
+    for vehicles, pedestrian_ids in intersections + list(recorded):
+        expected, encoded = legacy_encode(vehicles, pedestrian_ids, num_states), StateEncoderModel.encode(vehicles, pedestrian_ids)
+        assert np.allclose(expected[0], encoded[0]) and expected[1:] == encoded[1:], "state encoder does not match the previous encoding"
+    print('same state as the previous encoding -', states, 'random and', len(recorded), 'recorded intersections')
+
+    results = {}
+    for name, encode in (('if/elif', lambda v, p: legacy_encode(v, p, num_states)), ('state encoder', StateEncoderModel.encode)):
+        start_time = timeit.default_timer()
+        for vehicles, pedestrian_ids in intersections:
+            encode(vehicles, pedestrian_ids)
+        results[name] = states / (timeit.default_timer() - start_time)
+        print(name, '- states/s:', round(results[name]))
+    return results
+
+
+def _random_samples(count, num_states, num_actions):
+    """
+    Generate (state, action, reward, next_state) samples shaped like the ones produced by the simulation
+    """
+    states = np.random.rand(count + 1, num_states)
+    actions = np.random.randint(0, num_actions, size=count)
+    rewards = -np.random.rand(count) * 100
+    return [(states[i], int(actions[i]), float(rewards[i]), states[i + 1]) for i in range(count)]
+
+
+def bench_memory(size_max=50000, num_states=27, num_actions=3, batch_size=100, replays=800):
+    """
+    Compare insert and batch sampling throughput of the ring buffer memory against the list memory, at full capacity
+    """
+    samples = _random_samples(size_max * 2, num_states, num_actions)
+    results = {}
+
+    for name, memory in (('list', ListMemory(size_max, 600)), ('ring', Memory(size_max, 600, num_states))):
+        for sample in samples[:size_max]:  # fill the memory, eviction is measured on the second half
+            memory.add_sample(sample)
+
+        start_time = timeit.default_timer()
+        for sample in samples[size_max:]:
+            memory.add_sample(sample)
+        insert_time = timeit.default_timer() - start_time
+
+        start_time = timeit.default_timer()
+        for _ in range(replays):
+            batch = memory.get_samples(batch_size)
+            if name == 'list':  # the arrays that _replay used to rebuild from the tuples
+                states = np.array([val[0] for val in batch])
+                next_states = np.array([val[3] for val in batch])
+        sample_time = timeit.default_timer() - start_time
+
+        results[name] = {'inserts_per_s': size_max / insert_time, 'batches_per_s': replays / sample_time}
+        print(name, '- inserts/s:', round(size_max / insert_time), '- batches/s:', round(replays / sample_time))
+
+    print('Speedup - insert: x', round(results['ring']['inserts_per_s'] / results['list']['inserts_per_s'], 1),
+          '- sample: x', round(results['ring']['batches_per_s'] / results['list']['batches_per_s'], 1))
+    return results
+
+
+def bench_prioritized_memory(size_max=50000, num_states=27, num_actions=3, batch_size=100, replays=800):
+    """
+    Compare the batch sampling throughput of the prioritized memory, including the update of the priorities, against the uniform memory
+    """
+    states, actions, rewards, next_states = (np.array(field) for field in zip(*_random_samples(size_max, num_states, num_actions)))
+    results = {}
+
+    for name, memory in (('uniform', Memory(size_max, 600, num_states)), ('prioritized', PrioritizedMemory(size_max, 600, num_states))):
+        memory.add_batch(states, actions, rewards, next_states)
+
+        start_time = timeit.default_timer()
+        for _ in range(replays):
+            batch = memory.get_samples(batch_size)
+            if name == 'prioritized':
+                memory.update_priorities(batch[4], np.random.randn(len(batch[4])))  # td errors of the replay
+        sample_time = timeit.default_timer() - start_time
+
+        results[name] = replays / sample_time
+        print(name, '- batches/s:', round(results[name]))
+
+    print('Prioritized / uniform sampling throughput:', round(results['prioritized'] / results['uniform'], 2))
+    return results
+
+
+def _train_model(config):
+    """
+    Build the network of the training settings
+    """
+    from model import TrainModel  # imported here, so that the other benchmarks run without tensorflow
+
+    return TrainModel(config['num_layers'], config['width_layers'], config['batch_size'], config['learning_rate'],
+                      input_dim=config['num_states'], output_dim=config['num_actions'], target_update=config['target_update'],
+                      target_sync_interval=config['target_sync_interval'], target_tau=config['target_tau'], double_dqn=config['double_dqn'])
+
+
+def bench_train_step(config_file='training_settings.ini', steps=800):
+    """
+    Report the training steps/s of the network from the training settings, for the compiled fused step and for predict_batch + train_on_batch
+    """
+    config = import_train_configuration(config_file)
+    Model = _train_model(config)
+    batch_size = config['batch_size']
+    states = np.random.rand(batch_size, config['num_states']).astype(np.float32)
+    next_states = np.random.rand(batch_size, config['num_states']).astype(np.float32)
+    actions = np.random.randint(0, config['num_actions'], size=batch_size).astype(np.int32)
+    rewards = (-np.random.rand(batch_size) * 100).astype(np.float32)
+
+    def on_batch_step():
+        q_all = Model.predict_batch(np.concatenate((states, next_states)))
+        q_s_a, q_s_a_d = q_all[:batch_size], q_all[batch_size:]
+        q_s_a[np.arange(batch_size), actions] = rewards + config['gamma'] * np.amax(q_s_a_d, axis=1)
+        Model.train_batch(states, q_s_a)
+
+    def compiled_step():
+        Model.train_step(states, actions, rewards, next_states, config['gamma'])
+
+    results = {}
+    for name, step in (('train_on_batch', on_batch_step), ('compiled', compiled_step)):
+        step()  # the first call traces and builds the graph
+        start_time = timeit.default_timer()
+        for _ in range(steps):
+            step()
+        results[name] = steps / (timeit.default_timer() - start_time)
+        print(name, '- network:', config['num_layers'], 'x', config['width_layers'], '- train steps/s:', round(results[name], 1))
+    return results
+
+
+def bench_replay(config_file='training_settings.ini', epochs=800):
+    """
+    Report the replay updates/s of the training simulation, sampling of a full memory and training step, for the uniform and prioritized memories
+    """
+    config = import_train_configuration(config_file)
+    Model = _train_model(config)
+    num_states = config['num_states']
+    samples = [np.array(field) for field in zip(*_random_samples(config['memory_size_max'], num_states, config['num_actions']))]
+    memories = (('uniform', Memory(config['memory_size_max'], config['memory_size_min'], num_states)),
+                ('prioritized', PrioritizedMemory(config['memory_size_max'], config['memory_size_min'], num_states, config['priority_alpha'], config['priority_beta'])))
+    results = {}
+    for name, memory in memories:
+        memory.add_batch(*samples)
+        Episode = Simulation(Model, memory, None, config['gamma'], config['max_steps'], config['green_duration'], config['yellow_duration'],
+                             num_states, config['num_actions'], config['training_epochs'])
+        Episode.run_training(1)  # the first call traces and builds the graph
+        start_time = timeit.default_timer()
+        Episode.run_training(epochs)
+        results[name] = epochs / (timeit.default_timer() - start_time)
+        print(name, '- replay updates/s:', round(results[name], 1))
+    return results
+
+
+def bench_predict_one(Model, num_states=27, decisions=2000, keras_decisions=200):
+    """
+    Measure the decision latency of predict_one on single states, against the Keras predict call it replaces
+    """
+    states = np.random.rand(decisions, num_states)
+    results = {}
+    candidates = [('predict_one', Model.predict_one, decisions)]
+    if hasattr(Model, '_model'):  # keras models, compared with the plain predict call, fewer decisions as it is much slower
+        candidates.insert(0, ('keras predict', lambda state: Model._model.predict(np.reshape(state, [1, num_states]), verbose=0), keras_decisions))
+    for name, predict, count in candidates:
+        predict(states[0])  # the first call traces and builds the graph
+        latencies = np.zeros(count)
+        for i in range(count):
+            start_time = timeit.default_timer()
+            predict(states[i])
+            latencies[i] = timeit.default_timer() - start_time
+        results[name] = {'p' + str(q) + '_ms': value for q, value in zip(LATENCY_PERCENTILES, np.percentile(latencies, LATENCY_PERCENTILES) * 1000)}
+        print(name, '- latency', ' - '.join('p%d: %.3f ms' % (q, results[name]['p%d_ms' % q]) for q in LATENCY_PERCENTILES))
+    return results
+
+
+def check_numpy_model(model_path, num_states=27, count=1000):
+    """
+    Check that the numpy model matches the Keras output of a trained model, and compare their loading time and latency
+    """
+    start_time = timeit.default_timer()
+    from numpy_model import NumpyTestModel
+    NumpyModel = NumpyTestModel(num_states, model_path)
+    numpy_load_time = timeit.default_timer() - start_time
+
+    start_time = timeit.default_timer()
+    from model import TestModel
+    KerasModel = TestModel(num_states, model_path)
+    keras_load_time = timeit.default_timer() - start_time
+
+    states = np.random.rand(count, num_states)
+    keras_q = np.concatenate([KerasModel.predict_one(state) for state in states])
+    numpy_q = np.concatenate([NumpyModel.predict_one(state) for state in states])
+    max_error = np.max(np.abs(keras_q - numpy_q))
+    same_action = np.mean(np.argmax(keras_q, axis=1) == np.argmax(numpy_q, axis=1))
+    print('numpy model - max abs error:', max_error, '- same action:', round(same_action * 100, 2), '%')
+    print('load time - keras:', round(keras_load_time, 2), 's - numpy:', round(numpy_load_time, 2), 's')
+    latency = bench_predict_one(NumpyModel, num_states)
+    assert np.allclose(keras_q, numpy_q, rtol=1e-4, atol=1e-4), "numpy model does not match the keras model"
+    return {'max_abs_error': max_error, 'same_action': same_action, 'keras_load_s': keras_load_time, 'numpy_load_s': numpy_load_time, 'latency': latency}
+
+
+class _StateRecorder:
+    """
+    Model that decides like the given one and keeps every state it is asked about
+    """
+    def __init__(self, Model):
+        self._Model = Model
+        self.states = []
+
+
+    def predict_one(self, state):
+        self.states.append(np.asarray(state, dtype=np.float32))
+        return self._Model.predict_one(state)
+
+
+def record_test_states(model_path, num_states=27, max_steps=3600, seed=10000):
+    """
+    Run a testing episode of the model and return the states that it decided on
+    """
+    from numpy_model import NumpyTestModel
+    from testing_simulation import Simulation as TestSimulation
+
+    sumo_cmd = ['sumo', '-c', SUMOCFG_FILE, '--no-step-log', 'true', '--waiting-time-memory', str(max_steps), '--no-warnings', 'true',
+                '--duration-log.statistics', 'false', '--verbose', 'false']
+    Recorder = _StateRecorder(NumpyTestModel(num_states, model_path))
+    random.seed(seed)
+    TestSimulation(Recorder, sumo_cmd, max_steps, 10, 4, num_states, 3).run(seed)
+    return np.array(Recorder.states)
+
+
+def check_quantized_model(model_path, states, num_states=27):
+    """
+    Compare the TFLite exports of a trained model at every precision with the float32 numpy model on a set of states:
+    same action rate, value error and decision latency. The sizes are compared with the float32 export, the file deployed without quantization
+    """
+    from numpy_model import NumpyTestModel
+    from tflite_model import TFLiteTestModel, PRECISIONS
+
+    ReferenceModel = NumpyTestModel(num_states, model_path)
+    reference_q = np.concatenate([ReferenceModel.predict_one(state) for state in states])
+    print('numpy float32 -', len(states), 'states')
+    results = {'numpy_float32': {'latency': bench_predict_one(ReferenceModel, num_states)['predict_one']}}
+
+    reference_size = TFLiteTestModel(num_states, model_path, 'float32').model_size
+    for precision in PRECISIONS:
+        QuantizedModel = TFLiteTestModel(num_states, model_path, precision)
+        q = np.concatenate([QuantizedModel.predict_one(state) for state in states])
+        results['tflite_' + precision] = {
+            'same_action': float(np.mean(np.argmax(q, axis=1) == np.argmax(reference_q, axis=1))),
+            'max_abs_error': float(np.max(np.abs(q - reference_q))),
+            'max_relative_error': float(np.max(np.abs(q - reference_q)) / np.max(np.abs(reference_q))),
+            'size_mb': QuantizedModel.model_size / 2**20,
+            'size_ratio': QuantizedModel.model_size / reference_size,
+            'latency': bench_predict_one(QuantizedModel, num_states)['predict_one'],
+        }
+        print('tflite', precision, '- same action:', round(results['tflite_' + precision]['same_action'] * 100, 2), '% - max abs error:',
+              round(results['tflite_' + precision]['max_abs_error'], 5), '(' + str(round(results['tflite_' + precision]['max_relative_error'] * 100, 3)) + '%) - model:',
+              round(results['tflite_' + precision]['size_mb'], 2), 'MB (' + str(round(results['tflite_' + precision]['size_ratio'] * 100, 1)) + '% of float32)')
+    return results
+
+
+SUMOCFG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Network', 'foggybottommetro.sumocfg')
+
+
+def record_intersections(sumocfg_file=SUMOCFG_FILE, steps=3600, interval=10):
+    """
+    Record the car records and pedestrian ids that the simulation encodes, every interval steps of a run of the network
+    with its own traffic light program
+    """
+    sumo_cmd = ['sumo', '-c', sumocfg_file, '--no-step-log', 'true', '--no-warnings', 'true', '--duration-log.statistics', 'false', '--verbose', 'false']
+    Subscriptions = VehicleSubscriptions((tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION))
+    traci.start(sumo_cmd)
+    Subscriptions.reset()
+    intersections = []
+    for step in range(1, steps + 1):
+        traci.simulationStep()
+        Subscriptions.update()
+        if step % interval == 0:
+            vehicles = [(car_id, values[tc.VAR_ROAD_ID], values[tc.VAR_LANEPOSITION]) for car_id, values in Subscriptions.vehicles().items()]
+            intersections.append((vehicles, traci.person.getIDList()))
+    traci.close()
+    return intersections
+
+
+def bench_sumo_backends(sumocfg_file=SUMOCFG_FILE, steps=3600, backends=BACKENDS):
+    """
+    Report the simulation steps/s of the Foggy Bottom network under each sumo backend, with the vehicle subscriptions of the simulation
+    """
+    sumo_cmd = ['sumo', '-c', sumocfg_file, '--no-step-log', 'true', '--no-warnings', 'true', '--duration-log.statistics', 'false', '--verbose', 'false']
+    results = {}
+    for backend in backends:
+        use_backend(backend)
+        Subscriptions = VehicleSubscriptions((tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION, tc.VAR_ACCUMULATED_WAITING_TIME))
+        traci.start(sumo_cmd)
+        Subscriptions.reset()
+        start_time = timeit.default_timer()
+        for _ in range(steps):
+            traci.simulationStep()
+            Subscriptions.update()
+            Subscriptions.vehicles()
+        results[backend] = steps / (timeit.default_timer() - start_time)
+        traci.close()
+        print(backend, '- steps/s:', round(results[backend], 1))
+    return results
+
+
+def bench_trace_replay(sumocfg_file=SUMOCFG_FILE, steps=1800):
+    """
+    Record the simulation steps and vehicle subscriptions of a run into a trace, then replay it without sumo and check that the results match
+    """
+    sumo_cmd = ['sumo', '-c', sumocfg_file, '--no-step-log', 'true', '--no-warnings', 'true', '--duration-log.statistics', 'false', '--verbose', 'false']
+    backend = traci.backend
+    results = {}
+    outputs = {}
+    with tempfile.TemporaryDirectory() as folder:
+        trace_file = os.path.join(folder, 'trace.pkl.gz')
+        for mode in TRACE_BACKENDS:
+            use_backend(mode, trace_file)
+            Subscriptions = VehicleSubscriptions((tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION, tc.VAR_ACCUMULATED_WAITING_TIME))
+            start_time = timeit.default_timer()
+            traci.start(sumo_cmd)
+            Subscriptions.reset()
+            waiting_times = []
+            for _ in range(steps):
+                traci.simulationStep()
+                Subscriptions.update()
+                waiting_times.append(sum(values[tc.VAR_ACCUMULATED_WAITING_TIME] for values in Subscriptions.vehicles().values()))
+            traci.close()
+            results[mode] = steps / (timeit.default_timer() - start_time)
+            outputs[mode] = waiting_times
+            print(mode, '- steps/s:', round(results[mode], 1))
+        print('trace size:', round(os.path.getsize(trace_file) / 2**20, 2), 'MB - same results:', outputs['record'] == outputs['replay'])
+    use_backend(backend)
+    return results
+
+
+NETWORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Network')
+
+
+def _measure(function):
+    """
+    Run the function once, returning its duration and the peak of python memory allocated during the run
+    """
+    tracemalloc.start()
+    start_time = timeit.default_timer()
+    function()
+    duration = timeit.default_timer() - start_time
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return duration, peak
+
+
+def bench_route_writer(hours=(1, 8)):
+    """
+    Compare the minidom route file writer with the streaming writer of route_creator, for the Foggy Bottom demand repeated over several hours
+    """
+    sys.path.insert(0, NETWORK_DIR)
+    import route_creator as rc
+
+    results = {}
+    for hour_count in hours:
+        total_duration = 3600 * hour_count
+        vehicle_distribution = {trip: count * hour_count for trip, count in rc.vehicle_distribution.items()}
+        pedestrian_distribution = {ped: counts * hour_count for ped, counts in rc.pedestrian_distribution.items()}
+        num_trips = sum(vehicle_distribution.values()) + sum(sum(counts) for counts in pedestrian_distribution.values())
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = os.path.join(folder, 'routes.xml')
+            writers = {
+                'minidom': lambda: (rc.save_routes_to_file(rc.create_passenger_trips(rc.passenger_trips, vehicle_distribution, total_duration), file_path),
+                                    rc.save_routes_to_file(rc.create_pedestrian_trips(rc.pedestrian_trips, pedestrian_distribution, total_duration), file_path)),
+                'stream': lambda: (rc.write_routes_stream(rc.create_vehicle_types(), rc.stream_passenger_trips(rc.passenger_trips, vehicle_distribution, total_duration), file_path=file_path),
+                                   rc.write_routes_stream(rc.create_pedestrian_types(), rc.stream_pedestrian_trips(rc.pedestrian_trips, pedestrian_distribution, total_duration), file_path=file_path)),
+            }
+            for name, writer in writers.items():
+                duration, peak = _measure(writer)
+                results[name + '_' + str(hour_count) + 'h'] = {'trips': num_trips, 'seconds': duration, 'peak_mb': peak / 2**20}
+                print(name, '-', hour_count, 'h,', num_trips, 'trips - time:', round(duration, 2), 's - peak memory:', round(peak / 2**20, 2), 'MB')
+    return results
+
+
+def bench_episode(config_file='training_settings.ini', max_steps=900, epochs=100, epsilon=0.5):
+    """
+    Run a short training episode end to end, sumo simulation with the agent deciding then training session, and report the rate of each part
+    """
+    config = import_train_configuration(config_file)
+    Model = _train_model(config)  # the memory trains from the first batch, the short episode does not fill memory_size_min
+    sumo_cmd = ['sumo', '-c', SUMOCFG_FILE, '--no-step-log', 'true', '--waiting-time-memory', str(max_steps), '--no-warnings', 'true',
+                '--duration-log.statistics', 'false', '--verbose', 'false']
+    Environment = SumoEnvironment(sumo_cmd)
+    Episode = Simulation(Model, Memory(config['memory_size_max'], 1, config['num_states']), Environment, config['gamma'],
+                         max_steps, config['green_duration'], config['yellow_duration'], config['num_states'], config['num_actions'], epochs)
+    random.seed(0)
+
+    start_time = timeit.default_timer()
+    Episode.run_simulation(0, epsilon)
+    simulation_time = timeit.default_timer() - start_time
+    Environment.close()
+    start_time = timeit.default_timer()
+    Episode.run_training(epochs)
+    training_time = timeit.default_timer() - start_time
+
+    results = {
+        'simulation_steps_per_s': max_steps / simulation_time,
+        'replay_updates_per_s': epochs / training_time,
+        'episode_s': simulation_time + training_time,
+        'reset_ms': Environment.reset_time * 1000,
+    }
+    print('episode -', max_steps, 'steps:', round(results['simulation_steps_per_s'], 1), 'steps/s -', epochs, 'replays:',
+          round(results['replay_updates_per_s'], 1), 'updates/s - total:', round(results['episode_s'], 1), 's')
+    return results
+
+
+def bench_parallel(config_file='training_settings.ini', num_workers=2, max_steps=900, epsilon=0.5):
+    """
+    Simulate num_workers episodes one after the other, then at once in the worker processes of the parallel training,
+    and report the environment steps/s of each. Both act with a numpy copy of the model and no replay is done
+    """
+    from numpy_model import NumpyModel
+    from parallel_simulation import ParallelSimulation
+
+    config = import_train_configuration(config_file)
+    Model = _train_model(config)
+    sumo_cmd = ['sumo', '-c', SUMOCFG_FILE, '--no-step-log', 'true', '--waiting-time-memory', str(max_steps), '--no-warnings', 'true',
+                '--duration-log.statistics', 'false', '--verbose', 'false']
+    episodes = list(range(num_workers))
+    Environment = SumoEnvironment(sumo_cmd)
+    Policy = NumpyModel(config['num_states'], [])
+    Policy.set_weights(Model.get_weights())
+    Sequential = Simulation(Model, Memory(config['memory_size_max'], 1, config['num_states']), Environment, config['gamma'], max_steps,
+                            config['green_duration'], config['yellow_duration'], config['num_states'], config['num_actions'], 0, Policy=Policy)
+    start_time = timeit.default_timer()
+    for episode in episodes:
+        Sequential.run_simulation(episode, epsilon)
+    sequential_time = timeit.default_timer() - start_time
+
+    start_time = timeit.default_timer()
+    Parallel = ParallelSimulation(Model, Memory(config['memory_size_max'], 1, config['num_states']), Environment, config['gamma'], max_steps,
+                                  config['green_duration'], config['yellow_duration'], config['num_states'], config['num_actions'], 0, num_workers)
+    pool_start_time = timeit.default_timer() - start_time
+    start_time = timeit.default_timer()
+    Parallel.run(episodes, [epsilon] * num_workers)  # the first episodes of the workers include their start, imports and sumo launch
+    parallel_time = timeit.default_timer() - start_time
+    Parallel.close()
+    Environment.close()
+
+    results = {
+        'workers': num_workers,
+        'sequential_steps_per_s': num_workers * max_steps / sequential_time,
+        'parallel_steps_per_s': num_workers * max_steps / parallel_time,
+        'pool_start_s': pool_start_time,
+    }
+    print('sequential:', round(results['sequential_steps_per_s'], 1), 'steps/s -', num_workers, 'workers:', round(results['parallel_steps_per_s'], 1),
+          'steps/s - speedup: x', round(sequential_time / parallel_time, 2), '-', os.cpu_count(), 'cpus')
+    return results
+
+
+def _grid_network(folder, grid_number, steps):
+    """
+    Generate a grid network of grid_number x grid_number traffic lights and random trips over it, returning the sumo command
+    """
+    if 'SUMO_HOME' not in os.environ:
+        sys.exit("please declare environment variable 'SUMO_HOME'")
+    from sumolib import checkBinary
+
+    net_file = os.path.join(folder, 'grid.net.xml')
+    trips_file = os.path.join(folder, 'grid.trips.xml')
+    route_file = os.path.join(folder, 'grid.rou.xml')
+    subprocess.run([checkBinary('netgenerate'), '--grid', '--grid.number', str(grid_number), '--grid.length', '200', '--grid.attach-length', '200',
+                    '--default-junction-type', 'traffic_light', '--no-turnarounds', 'true', '--no-warnings', 'true', '-o', net_file], check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([sys.executable, os.path.join(os.environ['SUMO_HOME'], 'tools', 'randomTrips.py'), '-n', net_file, '-e', str(steps),
+                    '-p', str(4.0 / grid_number), '--fringe-factor', '10', '-o', trips_file, '-r', route_file, '--seed', '42'], check=True, stdout=subprocess.DEVNULL)
+    return net_file, ['sumo', '-n', net_file, '-r', route_file, '--no-step-log', 'true', '--no-warnings', 'true', '--duration-log.statistics', 'false',
+                      '--verbose', 'false', '--waiting-time-memory', str(steps)]
+
+
+def bench_multi_intersection(grid_numbers=(2, 4, 6, 8), steps=600, num_layers=4, width=400):
+    """
+    Run the multi-intersection controller on growing grids of traffic lights and report the time of a decision for all of them,
+    against one predict_one call per junction
+    """
+    from numpy_model import NumpyModel, layers_from_weights
+    from junction_index import JunctionIndex
+    from multi_simulation import MultiSimulation
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for grid_number in grid_numbers:
+            net_file, sumo_cmd = _grid_network(folder, grid_number, steps)
+            Junctions = JunctionIndex(net_file)
+            num_states = LaneCellEncoder(Junctions).num_states
+            dims = [num_states] + [width] * (num_layers + 1) + [int(Junctions.num_greens.max())]
+            weights = []
+            for input_size, output_size in zip(dims, dims[1:]):
+                weights += [np.random.randn(input_size, output_size).astype(np.float32) / np.sqrt(input_size), np.zeros(output_size, dtype=np.float32)]
+            Model = NumpyModel(num_states, layers_from_weights(weights))
+
+            Controller = MultiSimulation(Model, sumo_cmd, steps, 10, 4, Junctions)
+            simulation_time = Controller.run(0)
+            phases = Controller.instrumentation_episode['phases']
+            decisions = phases['choose_action']['calls']
+            decision_time = sum(phases[phase]['seconds'] for phase in ('get_state', 'choose_action', 'set_phases')) / decisions
+
+            states = np.random.rand(len(Junctions.tls_ids), num_states).astype(np.float32)
+            start_time = timeit.default_timer()
+            for _ in range(decisions):
+                for state in states:
+                    Model.predict_one(state)
+            looped_predict_time = (timeit.default_timer() - start_time) / decisions
+
+            results[len(Junctions.tls_ids)] = {
+                'decision_ms': decision_time * 1000,
+                'decision_ms_per_light': decision_time * 1000 / len(Junctions.tls_ids),
+                'batched_predict_ms': phases['choose_action']['seconds'] / decisions * 1000,
+                'looped_predict_ms': looped_predict_time * 1000,
+                'steps_per_s': steps / simulation_time,
+                'traci_calls_per_decision': sum(Controller.instrumentation_episode['traci_calls'].values()) / decisions,
+            }
+            print(len(Junctions.tls_ids), 'traffic lights - decision:', round(results[len(Junctions.tls_ids)]['decision_ms'], 3), 'ms - batched predict:',
+                  round(results[len(Junctions.tls_ids)]['batched_predict_ms'], 3), 'ms - predict_one per light:', round(looped_predict_time * 1000, 3), 'ms')
+    return results
+
+
+# stages of the suite, each one called with the training settings file
+STAGES = {
+    'memory': lambda config_file: bench_memory(),
+    'prioritized_memory': lambda config_file: bench_prioritized_memory(),
+    'state_encoder': lambda config_file: bench_state_encoder(recorded=record_intersections()),
+    'route_writer': lambda config_file: bench_route_writer(),
+    'sumo': lambda config_file: bench_sumo_backends(),
+    'trace_replay': lambda config_file: bench_trace_replay(),
+    'train_step': lambda config_file: bench_train_step(config_file),
+    'replay': lambda config_file: bench_replay(config_file),
+    'predict_one': lambda config_file: bench_predict_one(_train_model(import_train_configuration(config_file))),
+    'episode': lambda config_file: bench_episode(config_file),
+    'parallel': lambda config_file: bench_parallel(config_file),
+    'multi_intersection': lambda config_file: bench_multi_intersection(),
+}
+
+
+def _to_json(value):
+    """
+    Convert the results of a benchmark to json types, numpy numbers and arrays included
+    """
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def run_suite(stages, config_file='training_settings.ini'):
+    """
+    Run the given stages one after the other, returning their results with the duration of each stage and a description of the machine
+    """
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sumo_backend': traci.backend,
+        'stages': {},
+    }
+    for stage in stages:
+        print('\n-----', stage)
+        start_time = timeit.default_timer()
+        results = STAGES[stage](config_file)
+        report['stages'][stage] = {'results': _to_json(results), 'seconds': timeit.default_timer() - start_time}
+    return report
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the training pipeline, separately and end to end")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help="stages to run, all of them by default")
+    parser.add_argument('--config', default='training_settings.ini', help="training settings, for the network, memory and agent")
+    parser.add_argument('--numpy-model', help="folder of a trained model, e.g. models/model_20, to check the numpy model against keras")
+    parser.add_argument('--quantized-model', help="folder of a trained model, to check its float16 and int8 exports against the float32 model")
+    parser.add_argument('--states', help="npy file of the states of the quantized model check, recorded from a testing episode by default")
+    parser.add_argument('--output', default='benchmark_results.json', help="json file of the results")
+    args = parser.parse_args()
+
+    report = run_suite(args.stages, args.config)
+    if args.numpy_model:
+        print('\n----- numpy_model')
+        report['stages']['numpy_model'] = {'results': _to_json(check_numpy_model(args.numpy_model))}
+    if args.quantized_model:
+        print('\n----- quantized_model')
+        states = np.load(args.states) if args.states else record_test_states(args.quantized_model)
+        report['stages']['quantized_model'] = {'results': _to_json(check_quantized_model(args.quantized_model, states))}
+    with open(args.output, 'w') as json_file:
+        json.dump(report, json_file, indent=2)
+    print('\n----- Results saved at:', args.output)
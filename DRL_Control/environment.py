@@ -0,0 +1,77 @@
+import os
+import re
+import sys
+import timeit
+
+from sumo_backend import traci
+
+
+class SumoEnvironment:
+    def __init__(self, sumo_cmd, warmup_steps=0, snapshot_file=None):
+        self._sumo_cmd = sumo_cmd
+        self._warmup_steps = warmup_steps
+        self._snapshot_file = snapshot_file
+        self._running = False
+        self._reset_time = 0
+
+
+    def save_snapshot(self):
+        """
+        Simulate the warm-up once with the default traffic light program and save the state of sumo at the end of it
+        """
+        if self._warmup_steps == 0:
+            return
+        self._load()
+        traci.simulationStep(self._warmup_steps)  # run until the warm time in a single call
+        traci.simulation.saveState(self._snapshot_file)
+
+        # sumo may save the actuated traffic light programs with an empty state, that it refuses when loading the snapshot.
+        # The empty attribute is dropped, sumo restores the program from the network without it
+        with open(self._snapshot_file) as snapshot:
+            content = snapshot.read()
+        with open(self._snapshot_file, 'w') as snapshot:
+            snapshot.write(re.sub(r'(<tlLogic [^>]*?) state=""', r'\1', content))
+
+
+    def start(self, options=()):
+        """
+        Reset sumo for a new episode, forked from the warm-up snapshot if there is one.
+        The options are added to the sumo command for this episode only (route files, seed).
+        Returns the simulation step the episode starts from
+        """
+        start_time = timeit.default_timer()
+        self._load(options)
+        if self._warmup_steps > 0:
+            if not os.path.isfile(self._snapshot_file):
+                sys.exit("Warm-up snapshot not found: " + self._snapshot_file)
+            traci.simulation.loadState(self._snapshot_file)
+        # traci.load returns before sumo has reloaded, the first call that waits for an answer pays for it and is timed with the reset
+        start_step = int(traci.simulation.getTime())
+        self._reset_time = timeit.default_timer() - start_time
+
+        return start_step
+
+
+    def _load(self, options=()):
+        """
+        Start sumo the first time, then reload the network and the routes on the same connection
+        """
+        if self._running:
+            traci.load(self._sumo_cmd[1:] + list(options))
+        else:
+            traci.start(self._sumo_cmd + list(options))
+            self._running = True
+
+
+    def close(self):
+        """
+        Stop sumo at the end of the session
+        """
+        if self._running:
+            traci.close()
+            self._running = False
+
+
+    @property
+    def reset_time(self):
+        return self._reset_time
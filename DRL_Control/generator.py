@@ -0,0 +1,108 @@
+import os
+import sys
+import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+
+NETWORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Network')
+sys.path.append(NETWORK_DIR)
+import route_creator as rc
+
+
+# route files of the sumocfg that are not generated, the bus and metro lines keep their timetable
+FIXED_ROUTE_FILES = ('foggy.bus.trips.xml', 'foggy.metro.rou.xml')
+
+
+def generate_routes(route_folder, seed, demand_scale=1.0):
+    """
+    Generate the cars and pedestrians of an episode: the count of every trip is drawn from a poisson distribution
+    centered on the hourly demand tables, and the types of the trips are drawn with the same seed
+    """
+    rng = np.random.default_rng(seed)
+    vehicle_distribution = {trip: int(rng.poisson(count * demand_scale)) for trip, count in rc.vehicle_distribution.items()}
+    vehicle_distribution = {trip: count for trip, count in vehicle_distribution.items() if count > 0}
+    pedestrian_distribution = {ped: [int(rng.poisson(count * demand_scale)) for count in counts] for ped, counts in rc.pedestrian_distribution.items()}
+
+    shuffle_rng = random.Random(seed)
+    vehicle_file = os.path.join(route_folder, 'episode_%d.vehicle.trips.xml' % seed)
+    pedestrian_file = os.path.join(route_folder, 'episode_%d.pedestrian.rou.xml' % seed)
+    rc.write_routes_stream(rc.create_vehicle_types(), rc.stream_passenger_trips(rc.passenger_trips, vehicle_distribution, rng=shuffle_rng),
+                           file_path=vehicle_file)
+    rc.write_routes_stream(rc.create_pedestrian_types(), rc.stream_pedestrian_trips(rc.pedestrian_trips, pedestrian_distribution, rng=shuffle_rng),
+                           file_path=pedestrian_file)
+
+    return vehicle_file, pedestrian_file
+
+
+def route_options(vehicle_file, pedestrian_file):
+    """
+    Sumo options replacing the cars and pedestrians of the sumocfg with the generated ones
+    """
+    bus_file, metro_file = (os.path.join(NETWORK_DIR, file_name) for file_name in FIXED_ROUTE_FILES)
+    return ['--route-files', ','.join((vehicle_file, bus_file, pedestrian_file, metro_file))]
+
+
+class TrafficGenerator:
+    def __init__(self, route_folder, demand_scale=1.0, seed_step=1):
+        self._route_folder = route_folder
+        self._demand_scale = demand_scale
+        self._seed_step = seed_step  # difference between the seeds of two episodes run one after the other
+        self._executor = None
+        self._pending = {}  # generation of the route files of every seed asked in advance
+        self._route_files = ()
+        os.makedirs(route_folder, exist_ok=True)
+
+
+    def generate_routefile(self, seed):
+        """
+        Get the route files of the episode, generated in the background while the previous episode was running,
+        and start generating the ones of the next episode. Returns the sumo options loading them
+        """
+        for file_path in self._route_files:  # the previous episode is over, sumo does not read its files anymore
+            os.remove(file_path)
+        for other_seed in [other_seed for other_seed in self._pending if other_seed != seed]:  # episode run by another worker
+            for file_path in self._pending.pop(other_seed).result():
+                os.remove(file_path)
+        if seed not in self._pending:
+            self.prefetch(seed)
+        self._route_files = self._pending.pop(seed).result()
+        self.prefetch(seed + self._seed_step)
+
+        return route_options(*self._route_files)
+
+
+    def prefetch(self, seed):
+        """
+        Start generating the route files of an episode in the background
+        """
+        if self._executor is None:
+            # a worker process of the parallel training cannot start processes of its own, a thread is used there
+            daemon = multiprocessing.current_process().daemon
+            self._executor = ThreadPoolExecutor(1) if daemon else ProcessPoolExecutor(1)
+        if seed not in self._pending:
+            self._pending[seed] = self._executor.submit(generate_routes, self._route_folder, seed, self._demand_scale)
+
+
+    def close(self):
+        """
+        Stop the background generation and remove the route files left
+        """
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        for future in self._pending.values():
+            if not future.cancelled():
+                for file_path in future.result():
+                    os.remove(file_path)
+        self._pending = {}
+        for file_path in self._route_files:
+            os.remove(file_path)
+        self._route_files = ()
+
+
+    def __getstate__(self):
+        # a copy sent to a worker process starts without the executor and the files of this one
+        state = self.__dict__.copy()
+        state.update(_executor=None, _pending={}, _route_files=())
+        return state
@@ -0,0 +1,111 @@
+import timeit
+import numpy as np
+from collections import Counter
+
+from sumo_backend import traci
+from traci_trace import DOMAINS, FUNCTIONS
+
+
+LATENCY_PERCENTILES = (50, 99)
+# upper edges of the buckets of the decision latency histogram, in ms
+LATENCY_BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, float('inf'))
+
+_traci_counts = Counter()  # calls made through the traci of sumo_backend, by 'domain.method'
+
+
+class _CountingDomain:
+    def __init__(self, name, domain, counts):
+        self._name = name
+        self._domain = domain
+        self._counts = counts
+
+
+    def __getattr__(self, method):
+        wrapper = _counting_function(self._name + '.' + method, getattr(self._domain, method), self._counts)
+        setattr(self, method, wrapper)  # built once per method
+        return wrapper
+
+
+def _counting_function(key, function, counts):
+    def counting(*args):
+        counts[key] += 1
+        return function(*args)
+    return counting
+
+
+def count_traci_calls():
+    """
+    Count every call made through the traci of sumo_backend, returning the counts. The counting wrappers are installed once,
+    and again after a change of backend since use_backend copies the domains of the new module over them
+    """
+    if not isinstance(traci.simulation, _CountingDomain):
+        for name in DOMAINS:
+            setattr(traci, name, _CountingDomain(name, getattr(traci, name), _traci_counts))
+        for name in FUNCTIONS:
+            setattr(traci, name, _counting_function(name, getattr(traci, name), _traci_counts))
+    return _traci_counts
+
+
+class Instrumentation:
+    def __init__(self, count_traci=True):
+        """
+        Time spent in every phase of an episode, calls made to sumo and latency of the decisions of the model.
+        A measure costs a dictionary update, cheap next to a sumo step, so it stays on during the training
+        """
+        self._count_traci = count_traci
+        self.reset()
+
+
+    def reset(self):
+        """
+        Forget the measures, at the start of an episode or of a training session
+        """
+        self._seconds = {}
+        self._calls = {}
+        self._decision_latencies = []
+        self._traci_start = Counter(count_traci_calls()) if self._count_traci else None
+
+
+    def add(self, phase, seconds, calls=1):
+        """
+        Add the time of calls of a phase
+        """
+        self._seconds[phase] = self._seconds.get(phase, 0.0) + seconds
+        self._calls[phase] = self._calls.get(phase, 0) + calls
+
+
+    def timed(self, phase, function, *args):
+        """
+        Call the function, adding its time to the phase, and return its result
+        """
+        start_time = timeit.default_timer()
+        result = function(*args)
+        self.add(phase, timeit.default_timer() - start_time)
+        return result
+
+
+    def add_decision(self, seconds):
+        """
+        Add the latency of a decision taken by the model
+        """
+        self._decision_latencies.append(seconds)
+
+
+    def collect(self):
+        """
+        Summarize the measures since the last reset: time and calls of every phase, calls made to sumo by function,
+        and percentiles and histogram of the decision latency. The measures start over
+        """
+        record = {'phases': {phase: {'seconds': seconds, 'calls': self._calls[phase]} for phase, seconds in self._seconds.items()}}
+        if self._count_traci:
+            record['traci_calls'] = dict(count_traci_calls() - self._traci_start)
+        if self._decision_latencies:
+            latencies = np.array(self._decision_latencies) * 1000
+            histogram = np.bincount(np.searchsorted(LATENCY_BUCKETS_MS, latencies), minlength=len(LATENCY_BUCKETS_MS))
+            decision_latency = {'decisions': len(latencies)}
+            for q, value in zip(LATENCY_PERCENTILES, np.percentile(latencies, LATENCY_PERCENTILES)):
+                decision_latency['p' + str(q) + '_ms'] = float(value)
+            decision_latency['histogram_ms'] = {str(edge): int(count) for edge, count in zip(LATENCY_BUCKETS_MS, histogram)}  # decisions up to each edge
+            record['decision_latency'] = decision_latency
+        self.reset()
+        return record
@@ -0,0 +1,115 @@
+import numpy as np
+import sumolib
+
+
+GREEN_LIGHTS = 'Gg'
+
+
+def _is_green_phase(state):
+    """
+    A phase the agent can choose: some movements have green and none is clearing with yellow
+    """
+    return any(light in GREEN_LIGHTS for light in state) and not any(light in 'yY' for light in state)
+
+
+def _yellow_state(green_state, next_green_state):
+    """
+    Light state of the transition between two green phases: the movements that lose their green turn yellow
+    """
+    return ''.join('y' if light in GREEN_LIGHTS and next_light not in GREEN_LIGHTS else light for light, next_light in zip(green_state, next_green_state))
+
+
+class JunctionIndex:
+    def __init__(self, net_file, vehicle_class='passenger'):
+        """
+        Read the network once and list every traffic light with a choice of green phases, the phases of its first program
+        and its incoming lanes that the vehicle class can use
+        """
+        net = sumolib.net.readNet(net_file, withPrograms=True)
+        self._tls_ids = []
+        self._green_states = []  # light states of the green phases of every junction, the actions of the agent
+        self._lane_ids = []
+        lane_junctions = []
+        lane_slots = []
+        lane_lengths = []
+        for tls in net.getTrafficLights():
+            programs = tls.getPrograms()
+            if not programs:
+                continue
+            green_states = []
+            for phase in next(iter(programs.values())).getPhases():
+                if _is_green_phase(phase.state) and phase.state not in green_states:
+                    green_states.append(phase.state)
+            if len(green_states) < 2:  # a single green phase leaves nothing to decide
+                continue
+
+            junction_number = len(self._tls_ids)
+            self._tls_ids.append(tls.getID())
+            self._green_states.append(green_states)
+            incoming_lanes = []
+            for in_lane, _, _ in tls.getConnections():
+                if in_lane.allows(vehicle_class) and in_lane.getID() not in incoming_lanes:
+                    incoming_lanes.append(in_lane.getID())
+                    lane_lengths.append(in_lane.getLength())
+            self._lane_ids.extend(incoming_lanes)
+            lane_junctions.extend([junction_number] * len(incoming_lanes))
+            lane_slots.extend(range(len(incoming_lanes)))
+
+        self._yellow_states = [[[_yellow_state(old, new) for new in green_states] for old in green_states] for green_states in self._green_states]
+        self._lane_junctions = np.array(lane_junctions, dtype=np.int64)
+        self._lane_slots = np.array(lane_slots, dtype=np.int64)
+        self._lane_lengths = np.array(lane_lengths)
+        self._num_greens = np.array([len(green_states) for green_states in self._green_states], dtype=np.int64)
+        self._max_lanes = int(self._lane_slots.max()) + 1 if len(lane_slots) else 0
+
+
+    def junction_totals(self, lane_numbers, values):
+        """
+        Sum values by junction, given the number of the lane of every value in lane_ids
+        """
+        return np.bincount(self._lane_junctions[lane_numbers], weights=values, minlength=len(self._tls_ids))
+
+
+    @property
+    def tls_ids(self):
+        return self._tls_ids
+
+
+    @property
+    def lane_ids(self):
+        return self._lane_ids
+
+
+    @property
+    def lane_junctions(self):
+        return self._lane_junctions
+
+
+    @property
+    def lane_slots(self):
+        return self._lane_slots
+
+
+    @property
+    def lane_lengths(self):
+        return self._lane_lengths
+
+
+    @property
+    def max_lanes(self):
+        return self._max_lanes
+
+
+    @property
+    def num_greens(self):
+        return self._num_greens
+
+
+    @property
+    def green_states(self):
+        return self._green_states
+
+
+    @property
+    def yellow_states(self):
+        return self._yellow_states
@@ -1,36 +1,208 @@
 import random
+import threading
+import numpy as np
 
 class Memory:
-    def __init__(self, size_max, size_min):
-        self._samples = []
+    def __init__(self, size_max, size_min, num_states):
         self._size_max = size_max
         self._size_min = size_min
+        # preallocated ring buffer, one contiguous array per field of the (state, action, reward, next_state) sample
+        self._states = np.zeros((size_max, num_states), dtype=np.float32)
+        self._actions = np.zeros(size_max, dtype=np.int32)
+        self._rewards = np.zeros(size_max, dtype=np.float32)
+        self._next_states = np.zeros((size_max, num_states), dtype=np.float32)
+        self._next_index = 0  # slot that will be written by the next sample
+        self._size = 0
+        self._lock = threading.Lock()  # samples can be added by the simulation while the training thread samples
 
 
     def add_sample(self, sample):
         """
-        Add a sample into the memory
+        Add a sample into the memory, overwriting the oldest one when the memory is full
         """
-        self._samples.append(sample)
-        if self._size_now() > self._size_max:
-            self._samples.pop(0)  # if the length is greater than the size of memory, remove the oldest element
+        state, action, reward, next_state = sample
+        with self._lock:
+            self._states[self._next_index] = state
+            self._actions[self._next_index] = action
+            self._rewards[self._next_index] = reward
+            self._next_states[self._next_index] = next_state
+            self._written(self._next_index)
+            self._next_index = (self._next_index + 1) % self._size_max
+            if self._size < self._size_max:
+                self._size += 1
+
+
+    def add_batch(self, states, actions, rewards, next_states):
+        """
+        Add a batch of samples into the memory, overwriting the oldest ones when the memory is full
+        """
+        n = len(actions)
+        if n > self._size_max:  # only the most recent samples would be kept anyway
+            states, actions, rewards, next_states = states[-self._size_max:], actions[-self._size_max:], rewards[-self._size_max:], next_states[-self._size_max:]
+            n = self._size_max
+        with self._lock:
+            indices = (self._next_index + np.arange(n)) % self._size_max
+            self._states[indices] = states
+            self._actions[indices] = actions
+            self._rewards[indices] = rewards
+            self._next_states[indices] = next_states
+            self._written(indices)
+            self._next_index = (self._next_index + n) % self._size_max
+            self._size = min(self._size + n, self._size_max)
 
 
     def get_samples(self, n):
         """
-        Get n samples randomly from the memory
+        Get n samples randomly from the memory, as the arrays (states, actions, rewards, next_states)
         """
         if self._size_now() < self._size_min:
-            return []
+            return None
+
+        with self._lock:
+            n = min(n, self._size_now())  # get all the samples if there are less than "batch size"
+            indices = np.fromiter(random.sample(range(self._size_now()), n), dtype=np.int64, count=n)
+            return self._states[indices], self._actions[indices], self._rewards[indices], self._next_states[indices]
+
+
+    def get_all_samples(self):
+        """
+        Get every sample in the memory, as the arrays (states, actions, rewards, next_states)
+        """
+        with self._lock:
+            size = self._size_now()
+            return self._states[:size].copy(), self._actions[:size].copy(), self._rewards[:size].copy(), self._next_states[:size].copy()
 
-        if n > self._size_now():
-            return random.sample(self._samples, self._size_now())  # get all the samples
-        else:
-            return random.sample(self._samples, n)  # get "batch size" number of samples
+
+    def clear(self):
+        """
+        Remove every sample from the memory
+        """
+        with self._lock:
+            self._next_index = 0
+            self._size = 0
+
+
+    def _written(self, indices):
+        """
+        Called with the slots overwritten by new samples, while the memory is locked
+        """
+        pass
 
 
     def _size_now(self):
         """
         Check how full the memory is
         """
-        return len(self._samples)
\ No newline at end of file
+        return self._size
+
+
+class SumTree:
+    def __init__(self, capacity):
+        # complete binary tree in an array: the root is node 1, the children of node i are 2i and 2i+1,
+        # and the priorities are the leaves, from node self._leaves on
+        self._leaves = 1
+        while self._leaves < capacity:
+            self._leaves *= 2
+        self._depth = self._leaves.bit_length() - 1
+        self._nodes = np.zeros(2 * self._leaves)
+
+
+    def update(self, indices, priorities):
+        """
+        Set the priorities of the given leaves and update the sums of their ancestors, level by level
+        """
+        nodes = np.asarray(indices) + self._leaves
+        self._nodes[nodes] = priorities
+        for _ in range(self._depth):
+            nodes = nodes // 2  # a parent shared by several leaves is written several times with the same sum
+            self._nodes[nodes] = self._nodes[2 * nodes] + self._nodes[2 * nodes + 1]
+
+
+    def find(self, values):
+        """
+        Find the leaf of every value in [0, total), walking down the tree for all the values at once
+        """
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        for _ in range(self._depth):
+            left = 2 * nodes
+            go_right = values >= self._nodes[left]
+            values -= np.where(go_right, self._nodes[left], 0.0)
+            nodes = left + go_right
+        return nodes - self._leaves
+
+
+    def clear(self):
+        self._nodes[:] = 0
+
+
+    @property
+    def total(self):
+        return self._nodes[1]
+
+
+    @property
+    def priorities(self):
+        return self._nodes[self._leaves:]
+
+
+class PrioritizedMemory(Memory):
+    def __init__(self, size_max, size_min, num_states, alpha=0.6, beta=0.4, beta_increment=0.0, epsilon=1e-3):
+        super().__init__(size_max, size_min, num_states)
+        self._alpha = alpha  # how much the priorities count, 0 is uniform sampling
+        self._beta = beta  # how much the importance sampling weights correct the bias, annealed towards 1
+        self._beta_increment = beta_increment
+        self._epsilon = epsilon  # keeps every sample reachable when its td error is 0
+        self._tree = SumTree(size_max)
+        self._max_priority = 1.0
+
+
+    def _written(self, indices):
+        """
+        New samples get the highest priority seen, so that they are replayed at least once
+        """
+        self._tree.update(np.atleast_1d(indices), self._max_priority)
+
+
+    def get_samples(self, n):
+        """
+        Get n samples with a probability proportional to their priority, as the arrays
+        (states, actions, rewards, next_states, indices, weights), the weights correcting the bias of the sampling
+        """
+        if self._size_now() < self._size_min:
+            return None
+
+        with self._lock:
+            size = self._size_now()
+            n = min(n, size)
+            total = self._tree.total
+            # one value in each of n equal segments of the total priority
+            values = (np.arange(n) + np.random.random_sample(n)) * (total / n)
+            indices = np.minimum(self._tree.find(values), size - 1)
+
+            probabilities = self._tree.priorities[indices] / total
+            weights = (size * probabilities) ** -self._beta
+            weights = (weights / weights.max()).astype(np.float32)
+            self._beta = min(1.0, self._beta + self._beta_increment)
+            return self._states[indices], self._actions[indices], self._rewards[indices], self._next_states[indices], indices, weights
+
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Set the priorities of the samples from the td errors of their last replay
+        """
+        priorities = (np.abs(td_errors) + self._epsilon) ** self._alpha
+        with self._lock:
+            self._tree.update(indices, priorities)
+            self._max_priority = max(self._max_priority, float(priorities.max()))
+
+
+    def clear(self):
+        """
+        Remove every sample from the memory
+        """
+        with self._lock:
+            self._next_index = 0
+            self._size = 0
+            self._tree.clear()
+            self._max_priority = 1.0
@@ -12,13 +12,41 @@ from tensorflow.keras.utils import plot_model
 from tensorflow.keras.models import load_model
 
 
+def compile_predict(model, input_dim):
+    """
+    Build the graph-compiled forward pass of a model, with a fixed input signature so that it is traced only once
+    """
+    @tf.function(input_signature=[tf.TensorSpec(shape=(None, input_dim), dtype=tf.float32)])
+    def predict(states):
+        return model(states, training=False)
+
+    return predict
+
+
+TARGET_UPDATES = ('none', 'hard', 'soft')  # no target network, periodic copy of the weights, or polyak averaging
+
+
 class TrainModel:
-    def __init__(self, num_layers, width, batch_size, learning_rate, input_dim, output_dim):
+    def __init__(self, num_layers, width, batch_size, learning_rate, input_dim, output_dim, target_update='none', target_sync_interval=1000, target_tau=0.005, double_dqn=False):
         self._input_dim = input_dim
         self._output_dim = output_dim
         self._batch_size = batch_size
         self._learning_rate = learning_rate
+        if target_update not in TARGET_UPDATES:
+            sys.exit("Unknown target network update: " + target_update)
+        if double_dqn and target_update == 'none':
+            sys.exit("Double DQN evaluates the actions with the target network, set target_update to hard or soft")
+        self._target_update = target_update
+        self._target_sync_interval = target_sync_interval
+        self._target_tau = target_tau
+        self._double_dqn = double_dqn
+        self._train_steps = 0
         self._model = self._build_model(num_layers, width)
+        # the targets are bootstrapped from a copy of the network that follows it slowly, or from the network itself
+        self._target_model = self._build_target_model() if target_update != 'none' else self._model
+        self._predict = compile_predict(self._model, input_dim)
+        self._train_step = self._build_train_step()
+        self._sync_target = self._build_sync_target() if target_update == 'hard' else None
 
 
     def _build_model(self, num_layers, width):
@@ -34,28 +62,122 @@ class TrainModel:
         model = keras.Model(inputs=inputs, outputs=outputs, name='my_model')
         model.compile(loss=losses.mean_squared_error, optimizer=Adam(lr=self._learning_rate))
         return model
-    
+
+
+    def _build_target_model(self):
+        """
+        Build the target network, a copy of the trained network with its own weights
+        """
+        target_model = keras.models.clone_model(self._model)
+        target_model.set_weights(self._model.get_weights())
+        return target_model
+
+
+    def _build_sync_target(self):
+        """
+        Build the graph-compiled copy of the trained weights into the target network
+        """
+        online_variables = self._model.trainable_variables
+        target_variables = self._target_model.trainable_variables
+
+        @tf.function
+        def sync_target():
+            for target_variable, online_variable in zip(target_variables, online_variables):
+                target_variable.assign(online_variable)
+
+        return sync_target
+
+
+    def _build_train_step(self):
+        """
+        Build the graph-compiled training step: prediction of the q-value targets and gradient step fused in one call
+        """
+        model = self._model
+        target_model = self._target_model
+        double_dqn = self._double_dqn
+        soft_tau = self._target_tau if self._target_update == 'soft' else None
+        optimizer = model.optimizer
+        output_dim = self._output_dim
+        states_spec = tf.TensorSpec(shape=(None, self._input_dim), dtype=tf.float32)
+
+        @tf.function(input_signature=[
+            states_spec,
+            tf.TensorSpec(shape=(None,), dtype=tf.int32),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32),
+            states_spec,
+            tf.TensorSpec(shape=(), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32),
+        ])
+        def train_step(states, actions, rewards, next_states, gamma, weights):
+            action_mask = tf.one_hot(actions, output_dim)
+            q_s_a_d = target_model(next_states, training=False)  # Q(next_state), for every sample
+            if double_dqn:
+                # the trained network picks the next action and the target network values it. Its pass on the next states stays
+                # out of the gradient tape: batched with the states in the taped pass, the backward pass runs over twice the rows
+                next_actions = tf.one_hot(tf.argmax(model(next_states, training=False), axis=1), output_dim)
+                next_values = tf.reduce_sum(next_actions * q_s_a_d, axis=1)
+            else:
+                next_values = tf.reduce_max(q_s_a_d, axis=1)
+            targets = rewards + gamma * next_values
+
+            with tf.GradientTape() as tape:
+                q_s_a = model(states, training=True)
+                # only Q(state, action) is moved towards the target, the other action values keep their prediction
+                q_sa = tf.stop_gradient(action_mask * targets[:, None] + (1.0 - action_mask) * q_s_a)
+                loss = tf.reduce_mean(weights[:, None] * tf.square(q_sa - q_s_a))  # importance sampling weight of every sample
+
+            gradients = tape.gradient(loss, model.trainable_variables)
+            optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+            if soft_tau is not None:  # the polyak update of the target network is part of the same call
+                for target_variable, online_variable in zip(target_model.trainable_variables, model.trainable_variables):
+                    target_variable.assign(soft_tau * online_variable + (1.0 - soft_tau) * target_variable)
+            return targets - tf.reduce_sum(action_mask * q_s_a, axis=1)  # td error of every sample
+
+        return train_step
+
 
     def predict_one(self, state):
         """
         Predict the action values from a single state
         """
-        state = np.reshape(state, [1, self._input_dim])
-        return self._model.predict(state)
+        state = np.reshape(state, [1, self._input_dim]).astype(np.float32)
+        return self._predict(state).numpy()
 
 
     def predict_batch(self, states):
         """
         Predict the action values from a batch of states
         """
-        return self._model.predict(states)
+        return self._predict(np.asarray(states, dtype=np.float32)).numpy()
 
 
     def train_batch(self, states, q_sa):
         """
         Train the nn using the updated q-values
         """
-        self._model.fit(states, q_sa, epochs=1, verbose=0)
+        self._model.train_on_batch(states, q_sa)
+
+
+    def train_step(self, states, actions, rewards, next_states, gamma, weights=None):
+        """
+        Compute the q-value targets of a batch of samples and train the nn on them, in a single compiled call,
+        with the loss of every sample scaled by its weight. Returns the td errors of the samples
+        """
+        if weights is None:
+            weights = np.ones(len(actions), dtype=np.float32)
+        td_errors = self._train_step(states, actions, rewards, next_states, gamma, weights).numpy()
+
+        self._train_steps += 1
+        if self._target_update == 'hard' and self._train_steps % self._target_sync_interval == 0:
+            self._sync_target()
+        return td_errors
+
+
+    def get_weights(self):
+        """
+        Get the current weights of the nn, as a list of numpy arrays
+        """
+        return self._model.get_weights()
 
 
     def save_model(self, path):
@@ -85,6 +207,7 @@ class TestModel:
     def __init__(self, input_dim, model_path):
         self._input_dim = input_dim
         self._model = self._load_my_model(model_path)
+        self._predict = compile_predict(self._model, input_dim)
 
 
     def _load_my_model(self, model_folder_path):
@@ -104,8 +227,15 @@ class TestModel:
         """
         Predict the action values from a single state
         """
-        state = np.reshape(state, [1, self._input_dim])
-        return self._model.predict(state)
+        state = np.reshape(state, [1, self._input_dim]).astype(np.float32)
+        return self._predict(state).numpy()
+
+
+    def predict_batch(self, states):
+        """
+        Predict the action values from a batch of states
+        """
+        return self._predict(np.asarray(states, dtype=np.float32)).numpy()
 
 
     @property
@@ -0,0 +1,164 @@
+from sumo_backend import traci
+from traci import constants as tc
+import numpy as np
+import sys
+import timeit
+
+from subscriptions import VehicleSubscriptions
+from state_encoder import LaneCellEncoder
+from instrumentation import Instrumentation
+
+
+class MultiSimulation:
+    def __init__(self, Model, sumo_cmd, max_steps, green_duration, yellow_duration, Junctions):
+        self._Model = Model  # predicts the action values of every junction at once with predict_batch
+        self._Junctions = Junctions
+        self._Encoder = LaneCellEncoder(Junctions)
+        if Model.input_dim != self._Encoder.num_states:
+            sys.exit("The model takes " + str(Model.input_dim) + " states, the lane cell encoding of the junctions has " + str(self._Encoder.num_states) +
+                     ": the controller needs a model trained on the lane cell states, the models trained on the 27 states of the intersection do not fit")
+        self._step = 0
+        self._sumo_cmd = sumo_cmd
+        self._max_steps = max_steps
+        self._green_duration = green_duration
+        self._yellow_duration = yellow_duration
+        # the junctions have different numbers of green phases, the actions past them are never chosen
+        self._invalid_actions = np.arange(Junctions.num_greens.max()) >= Junctions.num_greens[:, None]
+        self._Subscriptions = VehicleSubscriptions((tc.VAR_LANE_ID, tc.VAR_LANEPOSITION, tc.VAR_ACCUMULATED_WAITING_TIME))
+        self._Instrumentation = Instrumentation()
+        self._reward_episode = []
+        self._queue_length_episode = []
+        self._junction_queue_length = np.zeros(len(Junctions.tls_ids))
+        self._instrumentation_episode = {}
+
+
+    def run(self, episode):
+        """
+        Runs the testing simulation, every traffic light of the network being controlled by the model
+        """
+        start_time = timeit.default_timer()
+
+        self._Instrumentation.reset()
+        self._Instrumentation.timed('reset', traci.start, self._sumo_cmd)
+        self._Subscriptions.reset()
+        for lane_id in self._Junctions.lane_ids:
+            traci.lane.subscribe(lane_id, (tc.LAST_STEP_VEHICLE_HALTING_NUMBER,))
+        print("Simulating", len(self._Junctions.tls_ids), "traffic lights...")
+
+        # inits
+        self._step = 0
+        self._reward_episode = []
+        self._queue_length_episode = []
+        self._junction_queue_length = np.zeros(len(self._Junctions.tls_ids))
+        old_waiting_times = np.zeros(len(self._Junctions.tls_ids))
+        old_actions = np.full(len(self._Junctions.tls_ids), -1)  # dummy init
+        while self._step < self._max_steps:
+
+            # get current state of every junction, and the waiting time of the cars on its incoming lanes
+            states, waiting_times = self._Instrumentation.timed('get_state', self._get_states)
+
+            # reward of the previous actions of every junction: change in the waiting time of its cars between actions
+            self._reward_episode.append(old_waiting_times - waiting_times)
+
+            # choose the light phase of every junction with one forward pass
+            actions = self._Instrumentation.timed('choose_action', self._choose_actions, states)
+
+            # the junctions that change phase go through yellow, the others keep their green running
+            changed = np.flatnonzero(actions != old_actions)
+            if self._step != 0 and changed.size:
+                self._Instrumentation.timed('set_phases', self._set_yellow_phases, changed, old_actions, actions)
+                self._simulate(self._yellow_duration)
+
+            self._Instrumentation.timed('set_phases', self._set_green_phases, changed, actions)
+            self._simulate(self._green_duration)
+
+            # saving variables for later
+            old_actions = actions
+            old_waiting_times = waiting_times
+
+        traci.close()
+        self._instrumentation_episode = dict(episode=episode, stage='test', **self._Instrumentation.collect())
+        simulation_time = round(timeit.default_timer() - start_time, 1)
+
+        return simulation_time
+
+
+    def _simulate(self, steps_todo):
+        """
+        Proceed with the simulation in sumo, recording the queue length of every junction
+        """
+        if (self._step + steps_todo) >= self._max_steps:  # do not do more steps than the maximum allowed number of steps
+            steps_todo = self._max_steps - self._step
+
+        lane_ids = self._Junctions.lane_ids
+        all_lanes = np.arange(len(lane_ids))
+        while steps_todo > 0:
+            traci.simulationStep()  # simulate 1 step in sumo
+            self._Subscriptions.update()
+            self._step += 1 # update the step counter
+            steps_todo -= 1
+            lanes = traci.lane.getAllSubscriptionResults()
+            halting = np.fromiter((lanes[lane_id][tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for lane_id in lane_ids), float, len(lane_ids))
+            queue_lengths = self._Junctions.junction_totals(all_lanes, halting)
+            self._junction_queue_length += queue_lengths
+            self._queue_length_episode.append(queue_lengths.sum())
+
+
+    def _get_states(self):
+        """
+        Retrieve the state matrix of the junctions, one row each, and the accumulated waiting time of the cars on their incoming lanes
+        """
+        vehicles = self._Subscriptions.vehicles()  # lane, lane position and waiting time of every car, received with the last step
+        lane_numbers = self._Encoder.lane_numbers((values[tc.VAR_LANE_ID] for values in vehicles.values()), len(vehicles))
+        on_junction_lanes = lane_numbers >= 0
+        lane_numbers = lane_numbers[on_junction_lanes]
+        lane_positions = np.fromiter((values[tc.VAR_LANEPOSITION] for values in vehicles.values()), float, len(vehicles))[on_junction_lanes]
+        waiting_times = np.fromiter((values[tc.VAR_ACCUMULATED_WAITING_TIME] for values in vehicles.values()), float, len(vehicles))[on_junction_lanes]
+        return self._Encoder.encode(lane_numbers, lane_positions), self._Junctions.junction_totals(lane_numbers, waiting_times)
+
+
+    def _choose_actions(self, states):
+        """
+        Pick the best green phase of every junction, from the action values of all the junctions predicted in a single batch
+        """
+        q_values = self._Model.predict_batch(states)[:, :self._invalid_actions.shape[1]]
+        q_values[self._invalid_actions] = -np.inf
+        return np.argmax(q_values, axis=1)
+
+
+    def _set_yellow_phases(self, changed, old_actions, actions):
+        """
+        Activate the yellow lights of the movements that lose their green, at the junctions that change phase
+        """
+        for junction in changed:
+            yellow_state = self._Junctions.yellow_states[junction][old_actions[junction]][actions[junction]]
+            traci.trafficlight.setRedYellowGreenState(self._Junctions.tls_ids[junction], yellow_state)
+
+
+    def _set_green_phases(self, changed, actions):
+        """
+        Activate the chosen green phase at the junctions that change phase. The light states set this way do not expire,
+        so the junctions that keep their phase need no call
+        """
+        for junction in changed:
+            traci.trafficlight.setRedYellowGreenState(self._Junctions.tls_ids[junction], self._Junctions.green_states[junction][actions[junction]])
+
+
+    @property
+    def queue_length_episode(self):
+        return self._queue_length_episode
+
+
+    @property
+    def junction_queue_length(self):
+        return self._junction_queue_length / max(self._step, 1)  # average queue length of every junction
+
+
+    @property
+    def reward_episode(self):
+        return self._reward_episode
+
+
+    @property
+    def instrumentation_episode(self):
+        return self._instrumentation_episode
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import numpy as np
+
+
+ACTIVATIONS = ('relu', 'linear')  # the activations of the dense layers built by TrainModel
+
+
+def load_h5_weights(model_file_path):
+    """
+    Read the kernel, bias and activation of every dense layer of a Keras h5 model file, without importing tensorflow
+    """
+    import h5py  # only needed when the weights have not been exported to npz yet
+
+    with h5py.File(model_file_path, 'r') as model_file:
+        model_config = model_file.attrs['model_config']
+        if isinstance(model_config, bytes):
+            model_config = model_config.decode('utf8')
+        weights_group = model_file['model_weights']
+
+        layers = []
+        for layer in json.loads(model_config)['config']['layers']:
+            if layer['class_name'] != 'Dense':
+                continue
+            group = weights_group[layer['config']['name']]
+            weights = {}
+            for weight_name in group.attrs['weight_names']:
+                if isinstance(weight_name, bytes):
+                    weight_name = weight_name.decode('utf8')
+                weights['kernel' if 'kernel' in weight_name else 'bias'] = np.asarray(group[weight_name], dtype=np.float32)
+            layers.append((weights['kernel'], weights['bias'], layer['config']['activation']))
+    return layers
+
+
+def save_npz_weights(layers, npz_file_path):
+    """
+    Export the dense layers to a npz file, that loads faster than the h5 file and needs only numpy
+    """
+    arrays = {}
+    for i, (kernel, bias, _) in enumerate(layers):
+        arrays['kernel_' + str(i)] = kernel
+        arrays['bias_' + str(i)] = bias
+    temporary_file_path = npz_file_path + '.' + str(os.getpid())  # the workers of a batch test may export the same model
+    with open(temporary_file_path, 'wb') as npz_file:
+        np.savez(npz_file, activations=np.array([activation for _, _, activation in layers]), **arrays)
+    os.replace(temporary_file_path, npz_file_path)
+
+
+def load_npz_weights(npz_file_path):
+    """
+    Read the dense layers exported by save_npz_weights
+    """
+    with np.load(npz_file_path) as data:
+        activations = [str(activation) for activation in data['activations']]
+        return [(data['kernel_' + str(i)], data['bias_' + str(i)], activation) for i, activation in enumerate(activations)]
+
+
+def layers_from_weights(weights):
+    """
+    Convert the weights list of a TrainModel, as returned by get_weights, into dense layers
+    """
+    layers = []
+    for i in range(0, len(weights), 2):
+        activation = 'linear' if i == len(weights) - 2 else 'relu'  # hidden layers use relu, the output layer is linear
+        layers.append((np.asarray(weights[i], dtype=np.float32), np.asarray(weights[i + 1], dtype=np.float32), activation))
+    return layers
+
+
+class NumpyModel:
+    def __init__(self, input_dim, layers):
+        self._input_dim = input_dim
+        self._layers = layers
+
+
+    def set_weights(self, weights):
+        """
+        Replace the dense layers with the weights of a TrainModel
+        """
+        self._layers = layers_from_weights(weights)
+
+
+    def predict_one(self, state):
+        """
+        Predict the action values from a single state
+        """
+        return self.predict_batch(np.reshape(state, [1, self._input_dim]))
+
+
+    def predict_batch(self, states):
+        """
+        Predict the action values from a batch of states, running the dense/ReLU stack in numpy
+        """
+        x = np.asarray(states, dtype=np.float32)
+        for kernel, bias, activation in self._layers:
+            x = x @ kernel
+            x += bias
+            if activation == 'relu':
+                np.maximum(x, 0, out=x)
+        return x
+
+
+    @property
+    def input_dim(self):
+        return self._input_dim
+
+
+class NumpyTestModel(NumpyModel):
+    def __init__(self, input_dim, model_path):
+        super().__init__(input_dim, self._load_my_model(model_path))
+
+
+    def _load_my_model(self, model_folder_path):
+        """
+        Load the weights of the model stored in the folder specified by the model number, from the npz export if it is up to date
+        """
+        model_file_path = os.path.join(model_folder_path, 'trained_model.h5')
+        npz_file_path = os.path.join(model_folder_path, 'trained_model.npz')
+
+        if os.path.isfile(npz_file_path) and (not os.path.isfile(model_file_path) or os.path.getmtime(npz_file_path) >= os.path.getmtime(model_file_path)):
+            layers = load_npz_weights(npz_file_path)
+        elif os.path.isfile(model_file_path):
+            layers = load_h5_weights(model_file_path)
+            save_npz_weights(layers, npz_file_path)  # cache the weights, so that the next start skips h5py
+        else:
+            sys.exit("Model number not found")
+
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                sys.exit("Activation not supported by the numpy model: " + activation)
+        return layers
@@ -0,0 +1,129 @@
+import multiprocessing
+import multiprocessing.util
+import timeit
+
+from training_simulation import Simulation
+from memory import Memory
+from numpy_model import NumpyModel
+from sumo_backend import traci, use_backend
+
+
+# simulation of the worker process and the model and memory it uses, built once by _init_worker
+_worker_simulation = None
+_worker_model = None
+_worker_memory = None
+
+
+def _init_worker(sumo_backend, Environment, TrafficGen, gamma, max_steps, green_duration, yellow_duration, num_states, num_actions):
+    """
+    Build the simulation of a worker process, acting with a numpy copy of the trained model so that tensorflow is not needed
+    """
+    global _worker_simulation, _worker_model, _worker_memory
+    use_backend(sumo_backend)  # the worker processes may not inherit the backend selected in the main process
+    _worker_model = NumpyModel(num_states, [])
+    _worker_memory = Memory(max_steps, 0, num_states)  # holds at most one sample per simulated step
+    multiprocessing.util.Finalize(None, Environment.close, exitpriority=10)  # the sumo of the worker runs until the pool stops
+    if TrafficGen is not None:
+        multiprocessing.util.Finalize(None, TrafficGen.close, exitpriority=10)
+    _worker_simulation = Simulation(
+        _worker_model,
+        _worker_memory,
+        Environment,
+        gamma,
+        max_steps,
+        green_duration,
+        yellow_duration,
+        num_states,
+        num_actions,
+        0,
+        TrafficGen=TrafficGen
+    )
+
+
+def _run_worker_episode(episode, epsilon, weights):
+    """
+    Run one episode in the worker process with the given weights and epsilon, returning its samples and stats
+    """
+    _worker_model.set_weights(weights)
+    _worker_memory.clear()
+    simulation_time = _worker_simulation.run_simulation(episode, epsilon)
+    stats = (_worker_simulation.reward_store[-1], _worker_simulation.cumulative_wait_store[-1], _worker_simulation.avg_queue_length_store[-1],
+             _worker_simulation.instrumentation_store[-1])
+    return _worker_memory.get_all_samples(), stats, simulation_time
+
+
+class ParallelSimulation:
+    def __init__(self, Model, Memory, Environment, gamma, max_steps, green_duration, yellow_duration, num_states, num_actions, training_epochs, num_workers, TrafficGen=None):
+        self._Model = Model
+        self._Memory = Memory
+        self._max_steps = max_steps
+        self._training_epochs = training_epochs
+        self._num_workers = num_workers
+        self._reward_store = []
+        self._cumulative_wait_store = []
+        self._avg_queue_length_store = []
+        self._instrumentation_store = []
+        # every worker process runs its own sumo instance, the connection of this process must not be inherited by them
+        Environment.close()
+        # the workers are started fresh rather than forked, a fork of a process running tensorflow threads can deadlock
+        self._pool = multiprocessing.get_context('spawn').Pool(
+            num_workers,
+            initializer=_init_worker,
+            initargs=(traci.backend, Environment, TrafficGen, gamma, max_steps, green_duration, yellow_duration, num_states, num_actions)
+        )
+        # the training is done in this process, by a simulation that does not run sumo itself
+        self._Simulation = Simulation(Model, Memory, Environment, gamma, max_steps, green_duration, yellow_duration, num_states, num_actions, training_epochs)
+
+
+    def run(self, episodes, epsilons):
+        """
+        Runs one episode per worker in parallel, each with its own epsilon, then starts a training session on the gathered samples
+        """
+        start_time = timeit.default_timer()
+        print("Simulating", len(episodes), "episodes in parallel...")
+        weights = self._Model.get_weights()
+        results = self._pool.starmap(_run_worker_episode, [(episode, epsilon, weights) for episode, epsilon in zip(episodes, epsilons)])
+
+        for (samples, stats, _), epsilon in zip(results, epsilons):
+            self._Memory.add_batch(*samples)
+            self._reward_store.append(stats[0])
+            self._cumulative_wait_store.append(stats[1])
+            self._avg_queue_length_store.append(stats[2])
+            self._instrumentation_store.append(stats[3])
+            print("Total reward:", stats[0], "- Epsilon:", round(epsilon, 2))
+        simulation_time = round(timeit.default_timer() - start_time, 1)
+        print("Environment steps/s:", round(len(episodes) * self._max_steps / simulation_time, 1), "- Worker time:", sum(result[2] for result in results), "s")
+
+        print("Training...")
+        training_time = self._Simulation.run_training(self._training_epochs * len(episodes))  # same number of replays per episode as the sequential training
+        self._instrumentation_store.append(dict(self._Simulation.instrumentation_store[-1], episode=episodes))  # one training session for the episodes
+
+        return simulation_time, training_time
+
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        self._pool.close()
+        self._pool.join()
+
+
+    @property
+    def reward_store(self):
+        return self._reward_store
+
+
+    @property
+    def cumulative_wait_store(self):
+        return self._cumulative_wait_store
+
+
+    @property
+    def avg_queue_length_store(self):
+        return self._avg_queue_length_store
+
+
+    @property
+    def instrumentation_store(self):
+        return self._instrumentation_store
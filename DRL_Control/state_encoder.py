@@ -0,0 +1,118 @@
+from bisect import bisect_right
+import numpy as np
+
+
+# traffic light of the intersection described by the state layout below, the one controlled by the single intersection simulations
+TLS_ID = 'cluster_49793670_9123357154_9123357155_9428447085'
+
+# lane cells of every incoming edge: the sorted lane position breakpoints and the cell of each interval between them
+EDGE_CELLS = {
+    '1120094388#0': ((), (0,)),
+    '1120094388#1': ((), (1,)),
+    '130285156#1': ((), (2,)),
+    '130285156#2': ((), (3,)),
+    '50799230#0': ((62.5, 135), (1, 2, 3)),  # I street
+    '50799230#3': ((9,), (3, 4)),  # I street
+    '-590598876#1': ((25, 50, 75), (1, 2, 3, 4)),
+}
+
+# movement number of a car, from the prefix of its id (the trip it was generated from)
+MOVEMENTS = {'veh1': 1, 'veh98': 2, 'veh0': 3, 'veh55': 4, 'veh51': 5, 'veh60': 6}
+
+# pedestrian group, from the prefix of the pedestrian id, and the state cell of every group
+PEDESTRIAN_GROUPS = {
+    'pedestrian1': 'c14', 'pedestrian3': 'c14',
+    'pedestrian2': 'c2', 'pedestrian4': 'c2',
+    'pedestrian5': 'c3', 'pedestrian6': 'c3',
+}
+PEDESTRIAN_CELLS = {'c2': 24, 'c3': 25, 'c14': 26}
+
+
+class StateEncoder:
+    def __init__(self, num_states, edge_cells=EDGE_CELLS, movements=MOVEMENTS, pedestrian_groups=PEDESTRIAN_GROUPS, pedestrian_cells=PEDESTRIAN_CELLS):
+        self._num_states = num_states
+        self._edge_cells = dict(edge_cells)
+        self._movements = dict(movements)
+        self._num_movements = max(movements.values())
+        self._pedestrian_groups = dict(pedestrian_groups)
+        self._pedestrian_cells = dict(pedestrian_cells)
+
+
+    def encode(self, vehicles, pedestrian_ids):
+        """
+        Map the (car id, edge id, lane position) records and the pedestrian ids to the cell occupancy state of the intersection.
+        Returns the state and the pedestrian counts c14, c2, c3
+        """
+        pedestrian_counts = dict.fromkeys(self._pedestrian_cells, 0)
+        for pedestrian_id in pedestrian_ids:
+            group = self._pedestrian_groups.get(pedestrian_id.partition('_')[0])
+            if group is not None:
+                pedestrian_counts[group] += 1
+
+        cell_counts = {}  # count of every cell key, in the order the cars were first seen
+        for car_id, edge_name, lane_pos in vehicles:
+            lane = self._edge_cells.get(edge_name)
+            movement_number = self._movements.get(car_id.partition('_')[0])
+            if lane is not None and movement_number is not None:
+                breakpoints, cells = lane
+                key = (cells[bisect_right(breakpoints, lane_pos)] - 1) * self._num_movements + (movement_number - 1)
+                cell_counts[key] = cell_counts.get(key, 0) + 1
+
+        state = np.zeros(self._num_states)
+        total = sum(cell_counts.values()) + sum(pedestrian_counts.values())
+        if total == 0:
+            return state, 0, 0, 0
+
+        # the keys of lane cell 0 are negative and wrap around to the end of the state, where the key seen last is kept
+        for key, count in cell_counts.items():
+            state[key] = count
+        for group, count in pedestrian_counts.items():  # the pedestrian cells are written last
+            state[self._pedestrian_cells[group]] = count
+        state /= total
+
+        return state, pedestrian_counts['c14'], pedestrian_counts['c2'], pedestrian_counts['c3']
+
+
+# distances to the stop line, in m, that split the incoming lanes into cells: short cells near the junction, long ones far from it
+CELL_BREAKPOINTS = (7, 14, 21, 28, 40, 60, 100, 160, 400)
+
+
+class LaneCellEncoder:
+    def __init__(self, Junctions, cell_breakpoints=CELL_BREAKPOINTS):
+        """
+        Cell occupancy state of every junction of a JunctionIndex, from the lane and lane position of the vehicles.
+        A junction has a row of max_lanes * cells values, its lanes taking the first slots
+        """
+        num_cells = len(cell_breakpoints) + 1
+        self._lane_numbers = {lane_id: lane_number for lane_number, lane_id in enumerate(Junctions.lane_ids)}
+        self._breakpoints = np.array(cell_breakpoints, dtype=float)
+        self._lane_lengths = Junctions.lane_lengths
+        self._num_junctions = len(Junctions.tls_ids)
+        self._num_states = Junctions.max_lanes * num_cells
+        # position of the first cell of every lane in the flattened state matrix
+        self._lane_offsets = Junctions.lane_junctions * self._num_states + Junctions.lane_slots * num_cells
+
+
+    def lane_numbers(self, lane_ids, count):
+        """
+        Number of every lane id in the junction lanes, -1 for the lanes that do not enter a junction
+        """
+        return np.fromiter((self._lane_numbers.get(lane_id, -1) for lane_id in lane_ids), np.int64, count)
+
+
+    def encode(self, lane_numbers, lane_positions):
+        """
+        Map the lane numbers and lane positions of the vehicles on junction lanes to the state matrix, one row per junction:
+        the share of the vehicles of the junction in every cell, like the cell occupancy of StateEncoder
+        """
+        distances = self._lane_lengths[lane_numbers] - lane_positions
+        cells = self._lane_offsets[lane_numbers] + np.searchsorted(self._breakpoints, distances, side='right')
+        states = np.bincount(cells, minlength=self._num_junctions * self._num_states).reshape(self._num_junctions, self._num_states)
+        states = states.astype(np.float32)
+        states /= np.maximum(states.sum(axis=1, keepdims=True), 1)
+        return states
+
+
+    @property
+    def num_states(self):
+        return self._num_states
@@ -0,0 +1,91 @@
+from sumo_backend import traci
+from traci import constants as tc
+
+
+class VehicleSubscriptions:
+    def __init__(self, variables):
+        self._variables = tuple(variables)
+        self._arrived = []
+        self._initial_results = None
+
+
+    def reset(self):
+        """
+        Subscribe to the vehicles already in the simulation and to the list of departing vehicles, right after sumo is started
+        """
+        traci.simulation.subscribe((tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS))
+        self._arrived = []
+        # after traci.load the results of the previous episode are kept until the first step, so the results given with every subscription are used instead
+        self._initial_results = {}
+        for vehicle_id in traci.vehicle.getIDList():
+            traci.vehicle.subscribe(vehicle_id, self._variables)
+            self._initial_results[vehicle_id] = traci.vehicle.getSubscriptionResults(vehicle_id)
+
+
+    def update(self):
+        """
+        Subscribe to the vehicles that departed in the last simulation step and keep track of the arrived ones, to be called after every step
+        """
+        self._initial_results = None
+        results = traci.simulation.getSubscriptionResults()
+        for vehicle_id in results[tc.VAR_DEPARTED_VEHICLES_IDS]:
+            traci.vehicle.subscribe(vehicle_id, self._variables)
+        self._arrived.extend(results[tc.VAR_ARRIVED_VEHICLES_IDS])
+
+
+    def vehicles(self):
+        """
+        Retrieve the subscribed variables of every vehicle in the simulation, as {vehicle id: {variable: value}}
+        """
+        if self._initial_results is not None:
+            return self._initial_results
+        return traci.vehicle.getAllSubscriptionResults()
+
+
+    def pop_arrived(self):
+        """
+        Retrieve the vehicles that left the simulation since the last call
+        """
+        arrived = self._arrived
+        self._arrived = []
+        return arrived
+
+
+class WaitingTimeTracker:
+    def __init__(self, Subscriptions):
+        self._Subscriptions = Subscriptions  # vehicles must be subscribed to VAR_ACCUMULATED_WAITING_TIME
+        self.reset()
+
+
+    def reset(self):
+        """
+        Forget every agent, at the start of an episode
+        """
+        self._waiting_times = {}  # last waiting time collected for every agent in the simulation
+        self._pedestrian_ids = set()
+        self._departed_total = 0  # last waiting time collected for the agents that left the simulation
+
+
+    def collect(self):
+        """
+        Update the waiting time of every car and pedestrian in the simulation and return the total, including the agents that left
+        """
+        for car_id in self._Subscriptions.pop_arrived():
+            self._departed_total += self._waiting_times.pop(car_id, 0)
+        for car_id, values in self._Subscriptions.vehicles().items():
+            self._waiting_times[car_id] = values[tc.VAR_ACCUMULATED_WAITING_TIME]
+
+        # there is no list of arrived pedestrians, they are found by comparing the ids with the previous call
+        pedestrian_list = traci.person.getIDList()
+        pedestrian_ids = set(pedestrian_list)
+        for pedestrian_id in self._pedestrian_ids - pedestrian_ids:
+            self._departed_total += self._waiting_times.pop(pedestrian_id, 0)
+        for pedestrian_id in pedestrian_list:  # in the order of sumo, the calls do not depend on the hashing of the ids
+            if pedestrian_id not in self._pedestrian_ids:
+                traci.person.subscribe(pedestrian_id, (tc.VAR_WAITING_TIME,))
+        self._pedestrian_ids = pedestrian_ids
+        results = traci.person.getAllSubscriptionResults()  # may still hold pedestrians of the previous episode right after traci.load
+        for pedestrian_id in pedestrian_list:
+            self._waiting_times[pedestrian_id] = results[pedestrian_id][tc.VAR_WAITING_TIME]
+
+        return self._departed_total + sum(self._waiting_times.values())
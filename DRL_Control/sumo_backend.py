@@ -0,0 +1,49 @@
+import os
+import sys
+import importlib
+
+from traci_trace import DOMAINS, FUNCTIONS, TraceRecorder, TraceReplayer
+
+
+BACKENDS = ('traci', 'libsumo')  # sumo over a TCP socket, or sumo running inside the python process
+TRACE_BACKENDS = ('record', 'replay')  # traci recording its calls to a trace file, or the trace served back without sumo
+# part of the traci module used by the simulations, the same with every backend
+SURFACE = DOMAINS + FUNCTIONS
+
+
+class SumoBackend:
+    def __init__(self, name):
+        self.backend = None
+        self._sumo_module = None  # module talking to sumo, the one recorded by the record backend
+        self.use(name)
+
+
+    def use(self, name, trace_file=None):
+        """
+        Select the python module used to talk to sumo. Its functions and domains are copied on this object in place of
+        the ones of the previous backend, so that traci.vehicle.getIDList() costs the same as with the module itself
+        """
+        if name in TRACE_BACKENDS:
+            if trace_file is None:
+                sys.exit("The " + name + " sumo backend needs a trace file")
+            module = TraceRecorder(importlib.import_module(self._sumo_module), trace_file) if name == 'record' else TraceReplayer(trace_file)
+        elif name in BACKENDS:
+            module = importlib.import_module(name)
+            self._sumo_module = name
+        else:
+            sys.exit("Unknown sumo backend: " + name)
+        self.__dict__.update({attribute: getattr(module, attribute) for attribute in SURFACE})
+        self.backend = name
+
+
+# the simulation modules do "from sumo_backend import traci" and use it like the traci module,
+# LIBSUMO_AS_TRACI selects libsumo by default like in the sumo tools
+traci = SumoBackend('libsumo' if os.environ.get('LIBSUMO_AS_TRACI') else 'traci')
+
+
+def use_backend(name, trace_file=None):
+    """
+    Switch every simulation module to the given backend, must be called before sumo is started.
+    'record' records the calls made to the backend in use into the trace file, 'replay' serves them back
+    """
+    traci.use(name, trace_file)
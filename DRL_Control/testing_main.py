@@ -2,20 +2,36 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os
+import sys
+import functools
 from shutil import copyfile
 
 from testing_simulation import Simulation
-from model import TestModel
 from visualization import Visualization
+from sumo_backend import use_backend
 from utils import import_test_configuration, set_sumo, set_test_path
 
 
 if __name__ == "__main__":
 
     config = import_test_configuration(config_file=r"C:\Users\Pedram\Downloads\finalversion_DRL\DRL_Control\testing_settings.ini")
+    if config['controller'] == 'multi':
+        # multi_simulation.MultiSimulation needs a model trained on the lane cell states, no training in this repo produces one yet
+        sys.exit("The multi-intersection controller needs a model trained on the lane cell states (state_encoder.LaneCellEncoder), training_main only trains the 27 state model, set controller to single")
+    elif config['controller'] != 'single':
+        sys.exit("Unknown controller: " + config['controller'])
     sumo_cmd = set_sumo(config['gui'], config['sumocfg_file_name'], config['max_steps'])
+    use_backend(config['sumo_backend'], config['trace_file'])  # traci over a socket, libsumo in process, or a recorded trace
     model_path, plot_path = set_test_path(config['models_path_name'], config['model_to_test'])
 
+    if config['inference_backend'] == 'numpy':
+        from numpy_model import NumpyTestModel as TestModel  # dense network evaluated in numpy, tensorflow is never imported
+    elif config['inference_backend'] == 'tflite':
+        from tflite_model import TFLiteTestModel  # quantized export of the network, run by a TFLite interpreter
+        TestModel = functools.partial(TFLiteTestModel, precision=config['inference_precision'])
+    else:
+        from model import TestModel
+
     Model = TestModel(
         input_dim=config['num_states'],
         model_path=model_path
@@ -46,6 +62,7 @@ if __name__ == "__main__":
     print("----- Testing info saved at:", plot_path)
 
     copyfile(src='testing_settings.ini', dst=os.path.join(plot_path, 'testing_settings.ini'))
+    Visualization.save_records(data=[Simulation.instrumentation_episode], filename='instrumentation')
 
     #Visualization.save_data_and_plot(data=Simulation.reward_episode, filename='reward', xlabel='Action step', ylabel='Reward')
     #Visualization.save_data_and_plot(data=Simulation.queue_length_episode, filename='queue', xlabel='Step', ylabel='Queue lenght (vehicles)')
@@ -1,9 +1,14 @@
-import traci
+from sumo_backend import traci
+from traci import constants as tc
 import numpy as np
 import random
 import timeit
 import os
 
+from subscriptions import VehicleSubscriptions, WaitingTimeTracker
+from state_encoder import StateEncoder, TLS_ID
+from instrumentation import Instrumentation
+
 # phase codes based on environment.net.xml
 PHASE_NS_GREEN = 0  # action 0 code 00
 PHASE_NS_YELLOW = 1
@@ -25,8 +30,13 @@ class Simulation:
         self._yellow_duration = yellow_duration
         self._num_states = num_states
         self._num_actions = num_actions
+        self._Subscriptions = VehicleSubscriptions((tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION, tc.VAR_ACCUMULATED_WAITING_TIME))
+        self._WaitingTimes = WaitingTimeTracker(self._Subscriptions)
+        self._StateEncoder = StateEncoder(num_states)
+        self._Instrumentation = Instrumentation()
         self._reward_episode = []
         self._queue_length_episode = []
+        self._instrumentation_episode = {}
 
 
     def run(self, episode):
@@ -37,28 +47,30 @@ class Simulation:
 
         # first, generate the route file for this simulation and set up sumo
         #self._TrafficGen.generate_routefile(seed=episode)
-        traci.start(self._sumo_cmd)
+        self._Instrumentation.reset()
+        self._Instrumentation.timed('reset', traci.start, self._sumo_cmd)
+        self._Subscriptions.reset()
         print("Simulating...")
 
         # inits
         self._step = 0
-        self._waiting_times = {}
+        self._WaitingTimes.reset()
         old_total_wait = 0
         old_action = -1 # dummy init
         totalwaitingtime=0
         while self._step < self._max_steps:
 
             # get current state of the intersection
-            current_state, c14,c2,c3= self._get_state()
+            current_state, c14,c2,c3= self._Instrumentation.timed('get_state', self._get_state)
 
             # calculate reward of previous action: (change in cumulative waiting time between actions)
             # waiting time = seconds waited by a car since the spawn in the environment, cumulated for every car in incoming lanes
-            totalwaitingtime+=self._collect_waiting_times()
-            current_total_wait = self._collect_waiting_times()
+            current_total_wait = self._Instrumentation.timed('collect_waiting_times', self._collect_waiting_times)
+            totalwaitingtime+=current_total_wait
             reward = old_total_wait - current_total_wait
 
             # choose the light phase to activate, based on the current state of the intersection
-            action = self._choose_action(current_state)
+            action = self._Instrumentation.timed('choose_action', self._choose_action, current_state)
 
             # if the chosen phase is different from the last phase, activate the yellow phase
             if self._step != 0 and old_action != action:
@@ -77,6 +89,7 @@ class Simulation:
 
         #print("Total reward:", np.sum(self._reward_episode))
         traci.close()
+        self._instrumentation_episode = dict(episode=episode, stage='test', **self._Instrumentation.collect())
         simulation_time = round(timeit.default_timer() - start_time, 1)
 
         return simulation_time,totalwaitingtime
@@ -89,38 +102,34 @@ class Simulation:
         if (self._step + steps_todo) >= self._max_steps:  # do not do more steps than the maximum allowed number of steps
             steps_todo = self._max_steps - self._step
 
+        steps = steps_todo
+        start_time = timeit.default_timer()
         while steps_todo > 0:
             traci.simulationStep()  # simulate 1 step in sumo
+            self._Subscriptions.update()
+            queue_length = self._get_queue_length() +c14+c2+c3
             self._step += 1 # update the step counter
             steps_todo -= 1
-            queue_length = self._get_queue_length() +c14+c2+c3
             self._queue_length_episode.append(queue_length)
+        self._Instrumentation.add('simulate', timeit.default_timer() - start_time, steps)  # sumo steps, subscription results and queue lengths
 
 
 
     def _collect_waiting_times(self):
         """
-        Retrieve the waiting time of every car in the incoming roads
+        Retrieve the total waiting time of every car and pedestrian seen in the episode
         """
-        incoming_roads = ["E2TL", "N2TL", "W2TL", "S2TL"]
-        car_list = traci.vehicle.getIDList()
-        for car_id in car_list:
-            wait_time = traci.vehicle.getAccumulatedWaitingTime(car_id)
-            road_id = traci.vehicle.getRoadID(car_id)  # get the road id where the car is located
-            self._waiting_times[car_id] = wait_time
-        pedestrian_ids = traci.person.getIDList()
-        for pedestrian_id in pedestrian_ids:
-            wait_time = traci.person.getWaitingTime(pedestrian_id)
-            self._waiting_times[pedestrian_id] = wait_time
-        total_waiting_time = sum(self._waiting_times.values())
-        return total_waiting_time
+        return self._WaitingTimes.collect()
 
 
     def _choose_action(self, state):
         """
         Pick the best action known based on the current state of the env
         """
-        return np.argmax(self._Model.predict_one(state))
+        start_time = timeit.default_timer()
+        action = np.argmax(self._Model.predict_one(state))
+        self._Instrumentation.add_decision(timeit.default_timer() - start_time)
+        return action
 
 
     def _set_yellow_phase(self, old_action):
@@ -128,7 +137,7 @@ class Simulation:
         Activate the correct yellow light combination in sumo
         """
         yellow_phase_code = old_action * 2 + 1 # obtain the yellow phase code, based on the old action (ref on environment.net.xml)
-        traci.trafficlight.setPhase("cluster_49793670_9123357154_9123357155_9428447085", 1)
+        traci.trafficlight.setPhase(TLS_ID, 1)
 
 
     def _set_green_phase(self, action_number):
@@ -136,11 +145,11 @@ class Simulation:
         Activate the correct green light combination in sumo
         """
         if action_number == 0:
-            traci.trafficlight.setPhase("cluster_49793670_9123357154_9123357155_9428447085", 0)
+            traci.trafficlight.setPhase(TLS_ID, 0)
         elif action_number == 1:
-            traci.trafficlight.setPhase("cluster_49793670_9123357154_9123357155_9428447085", 3)
+            traci.trafficlight.setPhase(TLS_ID, 3)
         elif action_number == 2:
-            traci.trafficlight.setPhase("cluster_49793670_9123357154_9123357155_9428447085", 6)
+            traci.trafficlight.setPhase(TLS_ID, 6)
 
 
 
@@ -161,129 +170,16 @@ class Simulation:
 
 
     def _get_state(self):
-        pick_random_elements = lambda car_list, factor: random.sample(car_list, int(len(car_list) * factor))
-
         """
-        Retrieve the state of the intersection from sumo, in the form of cell occupancy
+        Retrieve the state of the intersection from sumo, in the form of cell occupancy, seen by 40% of the cars and pedestrians
         """
-        state = np.zeros(self._num_states)
-        car_list = traci.vehicle.getIDList()
-        c2=0
-        c3=0
-        c14=0
-        extract_before_underscore = lambda word: word.split('_')[0]
-
-        pedestrian_ids = traci.person.getIDList()
-        pedestrian_ids=pick_random_elements(pedestrian_ids, 0.4)
-        for pedestrian_id in pedestrian_ids:
-            #print(pedestrian_id)
-            movement=extract_before_underscore(pedestrian_id)
-            #print(movement)
-            if movement=='pedestrian1' or movement=='pedestrian3':
-                c14+=1
-            elif movement=='pedestrian2' or movement=='pedestrian4':
-                c2+=1
-            elif movement=='pedestrian5' or movement=='pedestrian6':
-                c3+=1
-            '''
-            if traci.person.getRoadID(pedestrian_id)==':cluster_49793670_9123357154_9123357155_9428447085_w2':
-                c2+=1
-            elif traci.person.getRoadID(pedestrian_id)==':cluster_49793670_9123357154_9123357155_9428447085_w1':
-                c3+=1
-            elif traci.person.getRoadID(pedestrian_id)==':cluster_49793670_9123357154_9123357155_9428447085_w0':
-                c14+=1
-            '''
-        totalped=len(pedestrian_ids)
-
-        id_to_index = lambda a, b: (a - 1) * 6 + (b - 1)
-        sdic={}
-        car_list=pick_random_elements(car_list,0.4)
-        for car_id in car_list:
-            lane_pos = traci.vehicle.getLanePosition(car_id)
-            #lane_id = traci.vehicle.getLaneID(car_id)
-            edge_name=traci.vehicle.getRoadID(car_id)
-            #lane_pos = 750 - lane_pos  # inversion of lane pos, so if the car is close to the traffic light -> lane_pos = 0 --- 750 = max len of a road
-            weird_road=['1120094388#0' '1120094388#1' '130285156#1' '130285156#2 ']
-            if edge_name=='1120094388#0':
-                lane_cell=0
-            elif edge_name=='1120094388#1':
-                lane_cell=1
-            elif edge_name=='130285156#1':
-                lane_cell=2
-            elif edge_name=='130285156#2':
-                lane_cell=3
-            elif edge_name=='50799230#0':#I street
-                if lane_pos<62.5:
-                    lane_cell=1
-                elif lane_pos<135:
-                    lane_cell=2
-                else:
-                    lane_cell=3
-            elif edge_name=='50799230#3':#I street
-                if lane_pos<9:
-                    lane_cell=3
-                else:
-                    lane_cell=4
-            elif edge_name=='-590598876#1':
-                if lane_pos<25:
-                    lane_cell=1
-                elif lane_pos<50:
-                    lane_cell=2
-                elif lane_pos<75:
-                    lane_cell=3
-                else:
-                    lane_cell=4
-            else:
-                lane_cell=101
-            movement=extract_before_underscore(car_id)
-            if movement=='veh1':
-                movement_number=1
-            
-            elif movement=='veh98':
-                movement_number=2
-
-            elif movement=='veh0':
-                movement_number=3
-
-            elif movement=='veh55':
-                movement_number=4
-
-            elif movement=='veh51':
-                movement_number=5
-            elif movement=='veh60':
-                
-                movement_number=6
-            #print(edge_name)
-            if lane_cell!=101:
-                id=id_to_index (lane_cell,movement_number)
-                if id not in sdic.keys():
-                    sdic[id]=0
-                sdic[id]+=1
-        vehtopedratio=1
-        sdic[24]=c2/vehtopedratio
-        sdic[25]=c3/vehtopedratio
-        sdic[26]=c14/vehtopedratio
-        for id in sdic.keys():
-            total=sum(sdic.values())
-            if total==0:
-                total=1
-        
-            s=sdic[id]/total
-            #print(s)
-            state[id] = s 
-            #print(state) # write the position of the car car_id in the state array in the form of "cell occupied"
-        #state[24]=c2/totalped#/20 if c2<20 else 1
-        #state[25]=c3/totalped#/40 if c3<40 else 1
-        #state[26]=c14/totalped#/40 if c14<40 else 1
-        '''
-        if c2>10:
-            state[24]==1
-        elif c3>15:
-            state[25]==1
-        elif c14>15:
-            state[26]==1
-            '''
-        return state,c14,c2,c3
+        pick_random_elements = lambda car_list, factor: random.sample(car_list, int(len(car_list) * factor))
+
+        pedestrian_ids = pick_random_elements(traci.person.getIDList(), 0.4)
+        vehicles = self._Subscriptions.vehicles()  # road and lane position of every car, received with the last step
+        car_list = pick_random_elements(list(vehicles), 0.4)
+        records = [(car_id, vehicles[car_id][tc.VAR_ROAD_ID], vehicles[car_id][tc.VAR_LANEPOSITION]) for car_id in car_list]
+        return self._StateEncoder.encode(records, pedestrian_ids)
 
     @property
     def queue_length_episode(self):
@@ -295,4 +191,9 @@ class Simulation:
         return self._reward_episode
 
 
+    @property
+    def instrumentation_episode(self):
+        return self._instrumentation_episode
+
+
 
@@ -1,4 +1,4 @@
-import traci
+from sumo_backend import traci
 import numpy as np
 import random
 import timeit
@@ -0,0 +1,108 @@
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL']='2'  # kill warning about tensorflow
+import sys
+import numpy as np
+
+
+PRECISIONS = ('float32', 'float16', 'int8')  # weights of the exported model, int8 weights also run the dense layers in int8
+
+
+def _load_interpreter_class():
+    """
+    Find a TFLite interpreter, from the standalone runtimes first so that tensorflow is imported only when it is the one installed
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def export_tflite(model_file_path, tflite_file_path, precision):
+    """
+    Convert a Keras h5 model to a TFLite model with post-training quantization of the weights: float16 halves them,
+    int8 quarters them and quantizes the activations on the fly (dynamic range quantization)
+    """
+    import tensorflow as tf  # only needed to export, the exported model runs with any TFLite interpreter
+    from tensorflow.keras.models import load_model
+
+    if precision not in PRECISIONS:
+        sys.exit("Unknown model precision: " + precision)
+    converter = tf.lite.TFLiteConverter.from_keras_model(load_model(model_file_path, compile=False))
+    if precision != 'float32':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if precision == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    temporary_file_path = tflite_file_path + '.' + str(os.getpid())  # the workers of a batch test may export the same model
+    with open(temporary_file_path, 'wb') as tflite_file:
+        tflite_file.write(converter.convert())
+    os.replace(temporary_file_path, tflite_file_path)
+
+
+class TFLiteTestModel:
+    def __init__(self, input_dim, model_path, precision='int8'):
+        self._input_dim = input_dim
+        self._precision = precision
+        self._model_file_path = self._load_my_model(model_path)
+        self._interpreter = _load_interpreter_class()(model_path=self._model_file_path, num_threads=1)
+        self._interpreter.allocate_tensors()
+        self._input_index = self._interpreter.get_input_details()[0]['index']
+        self._output_index = self._interpreter.get_output_details()[0]['index']
+        self._batch_size = 1  # the tensors are allocated for one state, until a batch of another size is predicted
+
+
+    def _load_my_model(self, model_folder_path):
+        """
+        Find the TFLite model of the precision in the folder specified by the model number, exporting it from the h5 model if it is not up to date
+        """
+        model_file_path = os.path.join(model_folder_path, 'trained_model.h5')
+        tflite_file_path = os.path.join(model_folder_path, 'trained_model_' + self._precision + '.tflite')
+
+        if os.path.isfile(tflite_file_path) and (not os.path.isfile(model_file_path) or os.path.getmtime(tflite_file_path) >= os.path.getmtime(model_file_path)):
+            return tflite_file_path
+        elif os.path.isfile(model_file_path):
+            export_tflite(model_file_path, tflite_file_path, self._precision)
+            return tflite_file_path
+        else:
+            sys.exit("Model number not found")
+
+
+    def predict_one(self, state):
+        """
+        Predict the action values from a single state
+        """
+        return self._invoke(np.reshape(state, [1, self._input_dim]).astype(np.float32))
+
+
+    def predict_batch(self, states):
+        """
+        Predict the action values from a batch of states
+        """
+        return self._invoke(np.asarray(states, dtype=np.float32))
+
+
+    def _invoke(self, states):
+        """
+        Run the interpreter on the states, resizing its input and reallocating its tensors when the batch size changes
+        """
+        if len(states) != self._batch_size:
+            self._interpreter.resize_tensor_input(self._input_index, [len(states), self._input_dim])
+            self._interpreter.allocate_tensors()
+            self._batch_size = len(states)
+        self._interpreter.set_tensor(self._input_index, states)
+        self._interpreter.invoke()
+        return self._interpreter.get_tensor(self._output_index)
+
+
+    @property
+    def input_dim(self):
+        return self._input_dim
+
+
+    @property
+    def model_size(self):
+        return os.path.getsize(self._model_file_path)
@@ -0,0 +1,128 @@
+import gzip
+import pickle
+
+
+# domains and module functions that are recorded, the ones used by the simulations
+DOMAINS = ('simulation', 'vehicle', 'person', 'edge', 'lane', 'trafficlight', 'junction', 'route')
+FUNCTIONS = ('start', 'load', 'close', 'simulationStep', 'getVersion', 'isLoaded')
+# arguments that depend on the machine (paths of the sumo command) and are not compared on replay
+UNCHECKED_FUNCTIONS = ('start', 'load')
+
+
+class TraceMismatch(Exception):
+    """
+    Raised when the replayed code does not make the calls of the recorded run
+    """
+    pass
+
+
+class _RecordingDomain:
+    def __init__(self, name, domain, Recorder):
+        self._name = name
+        self._domain = domain
+        self._Recorder = Recorder
+
+
+    def __getattr__(self, method):
+        function = getattr(self._domain, method)
+        wrapper = lambda *args: self._Recorder.call(self._name, method, function, args)
+        setattr(self, method, wrapper)  # built once per method
+        return wrapper
+
+
+class TraceRecorder:
+    def __init__(self, module, trace_file):
+        """
+        Stand-in for the traci module that forwards every call to the given module and writes the call and its result to the trace
+        """
+        self._module = module
+        self._trace_file = trace_file
+        self._file = None
+        self._pickler = None
+        open(trace_file, 'wb').close()  # a new trace for every recorder, the episodes are appended to it
+        for name in DOMAINS:
+            setattr(self, name, _RecordingDomain(name, getattr(module, name), self))
+        for name in FUNCTIONS:
+            setattr(self, name, self._recording_function(name))
+
+
+    def _recording_function(self, name):
+        function = getattr(self._module, name)
+        return lambda *args: self.call('', name, function, args)
+
+
+    def call(self, domain, method, function, args):
+        """
+        Call the function and record (domain, method, arguments, outcome), the outcome being the result or the exception raised
+        """
+        if self._file is None:
+            self._file = gzip.open(self._trace_file, 'ab')
+            self._pickler = pickle.Pickler(self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            result = function(*args)
+        except Exception as error:
+            self._pickler.dump((domain, method, args, False, error))
+            raise
+        self._pickler.dump((domain, method, args, True, result))
+        self._pickler.clear_memo()  # every record stands alone, the memo would keep every result alive
+        if method == 'close':
+            self._file.close()
+            self._file = None
+        return result
+
+
+class _ReplayDomain:
+    def __init__(self, name, Replayer):
+        self._name = name
+        self._Replayer = Replayer
+
+
+    def __getattr__(self, method):
+        wrapper = lambda *args: self._Replayer.call(self._name, method, args)
+        setattr(self, method, wrapper)
+        return wrapper
+
+
+class TraceReplayer:
+    def __init__(self, trace_file):
+        """
+        Stand-in for the traci module that serves the results of a recorded run from memory, sumo is not needed
+        """
+        self._records = []
+        with gzip.open(trace_file, 'rb') as file:
+            while True:
+                try:
+                    self._records.append(pickle.load(file))
+                except EOFError:
+                    break
+        self._next_record = 0
+        for name in DOMAINS:
+            setattr(self, name, _ReplayDomain(name, self))
+        for name in FUNCTIONS:
+            setattr(self, name, self._replay_function(name))
+
+
+    def _replay_function(self, name):
+        return lambda *args: self.call('', name, args)
+
+
+    def call(self, domain, method, args):
+        """
+        Check that the call is the next one of the trace and return its recorded result, or raise its recorded exception
+        """
+        if self._next_record == len(self._records):
+            raise TraceMismatch("End of the trace reached by %s.%s%s" % (domain, method, args))
+        recorded_domain, recorded_method, recorded_args, returned, outcome = self._records[self._next_record]
+        if (domain, method) != (recorded_domain, recorded_method) or (args != recorded_args and method not in UNCHECKED_FUNCTIONS):
+            raise TraceMismatch("Call %d is %s.%s%s, the trace has %s.%s%s" % (self._next_record, domain, method, args, recorded_domain, recorded_method, recorded_args))
+        self._next_record += 1
+        if not returned:
+            raise outcome
+        return outcome
+
+
+    def rewind(self):
+        """
+        Serve the trace again from its first call
+        """
+        self._next_record = 0
@@ -2,13 +2,19 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os
+import sys
 import datetime
 from shutil import copyfile
 
 from training_simulation import Simulation
-from memory import Memory
+from environment import SumoEnvironment
+from generator import TrafficGenerator
+from parallel_simulation import ParallelSimulation
+from async_simulation import AsyncSimulation
+from memory import Memory, PrioritizedMemory
 from model import TrainModel
 from visualization import Visualization
+from sumo_backend import use_backend, TRACE_BACKENDS
 from utils import import_train_configuration, set_sumo, set_train_path
 
 
@@ -16,6 +22,13 @@ if __name__ == "__main__":
 
     config = import_train_configuration(config_file=r"C:\Users\Pedram\Desktop\GWU_UZilina_Colab\DRL_Control\training_settings.ini")
     sumo_cmd = set_sumo(config['gui'], config['sumocfg_file_name'], config['max_steps'])
+    if config['sumo_backend'] in TRACE_BACKENDS and config['num_workers'] > 1:
+        sys.exit("A sumo trace is recorded or replayed by a single simulation, set num_workers to 1")
+    if config['async_training'] and config['num_workers'] > 1:
+        sys.exit("The asynchronous training runs a single simulation, set num_workers to 1 or async_training to False")
+    if config['randomize_demand'] and config['warmup_steps'] > 0:
+        sys.exit("The warm-up snapshot holds the cars and pedestrians of the sumocfg, set warmup_steps to 0 to randomize the demand")
+    use_backend(config['sumo_backend'], config['trace_file'])  # traci over a socket, libsumo in process, or a recorded trace
     path = set_train_path(config['models_path_name'])
 
     Model = TrainModel(
@@ -24,42 +37,120 @@ if __name__ == "__main__":
         config['batch_size'], 
         config['learning_rate'], 
         input_dim=config['num_states'], 
-        output_dim=config['num_actions']
+        output_dim=config['num_actions'],
+        target_update=config['target_update'],
+        target_sync_interval=config['target_sync_interval'],
+        target_tau=config['target_tau'],
+        double_dqn=config['double_dqn']
     )
 
-    Memory = Memory(
-        config['memory_size_max'], 
-        config['memory_size_min']
-    )
+    if config['prioritized_replay']:
+        Memory = PrioritizedMemory(
+            config['memory_size_max'],
+            config['memory_size_min'],
+            config['num_states'],
+            config['priority_alpha'],
+            config['priority_beta'],
+            (1.0 - config['priority_beta']) / (config['total_episodes'] * config['training_epochs'])  # beta reaches 1 with the last replay
+        )
+    else:
+        Memory = Memory(
+            config['memory_size_max'], 
+            config['memory_size_min'],
+            config['num_states']
+        )
 
    
+    Environment = SumoEnvironment(
+        sumo_cmd,
+        config['warmup_steps'],
+        os.path.join(path, 'warmup_state.xml')
+    )
+    Environment.save_snapshot()  # every episode starts from the end of the same warm-up
+
+    TrafficGen = None  # every episode replays the route files of the sumocfg
+    if config['randomize_demand']:
+        TrafficGen = TrafficGenerator(
+            os.path.join(path, 'routes'),
+            config['demand_scale'],
+            seed_step=config['num_workers']
+        )
+
     Visualization = Visualization(
         path, 
         dpi=96
     )
         
-    Simulation = Simulation(
-        Model,
-        Memory,
-        sumo_cmd,
-        config['gamma'],
-        config['max_steps'],
-        config['green_duration'],
-        config['yellow_duration'],
-        config['num_states'],
-        config['num_actions'],
-        config['training_epochs']
-    )
+    if config['num_workers'] > 1:
+        Simulation = ParallelSimulation(
+            Model,
+            Memory,
+            Environment,
+            config['gamma'],
+            config['max_steps'],
+            config['green_duration'],
+            config['yellow_duration'],
+            config['num_states'],
+            config['num_actions'],
+            config['training_epochs'],
+            config['num_workers'],
+            TrafficGen=TrafficGen
+        )
+    elif config['async_training']:
+        Simulation = AsyncSimulation(
+            Model,
+            Memory,
+            Environment,
+            config['gamma'],
+            config['max_steps'],
+            config['green_duration'],
+            config['yellow_duration'],
+            config['num_states'],
+            config['num_actions'],
+            config['training_epochs'],
+            config['sync_interval'],
+            TrafficGen=TrafficGen
+        )
+    else:
+        Simulation = Simulation(
+            Model,
+            Memory,
+            Environment,
+            config['gamma'],
+            config['max_steps'],
+            config['green_duration'],
+            config['yellow_duration'],
+            config['num_states'],
+            config['num_actions'],
+            config['training_epochs'],
+            TrafficGen=TrafficGen
+        )
     
     episode = 0
     timestamp_start = datetime.datetime.now()
     
     while episode < config['total_episodes']:
-        print('\n----- Episode', str(episode+1), 'of', str(config['total_episodes']))
-        epsilon = 1.0 - (episode / config['total_episodes'])  # set the epsilon for this episode according to epsilon-greedy policy
-        simulation_time, training_time = Simulation.run(episode, epsilon)  # run the simulation
-        print('Simulation time:', simulation_time, 's - Training time:', training_time, 's - Total:', round(simulation_time+training_time, 1), 's')
-        episode += 1
+        if config['num_workers'] > 1:
+            episodes = list(range(episode, min(episode + config['num_workers'], config['total_episodes'])))
+            epsilons = [1.0 - (e / config['total_episodes']) for e in episodes]  # every worker follows the epsilon-greedy schedule of its own episode
+            print('\n----- Episodes', str(episodes[0]+1), 'to', str(episodes[-1]+1), 'of', str(config['total_episodes']))
+            simulation_time, training_time = Simulation.run(episodes, epsilons)  # run the simulations in parallel
+        else:
+            episodes = [episode]
+            print('\n----- Episode', str(episode+1), 'of', str(config['total_episodes']))
+            epsilon = 1.0 - (episode / config['total_episodes'])  # set the epsilon for this episode according to epsilon-greedy policy
+            simulation_time, training_time = Simulation.run(episode, epsilon)  # run the simulation
+        if config['async_training'] and config['num_workers'] == 1:
+            print('Simulation time:', simulation_time, 's - Training time:', training_time, 's - Overlap ratio:', round(Simulation.overlap_ratio_store[-1], 2))
+        else:
+            print('Simulation time:', simulation_time, 's - Training time:', training_time, 's - Total:', round(simulation_time+training_time, 1), 's')
+        episode += len(episodes)
+
+    if config['num_workers'] > 1 or config['async_training']:
+        Simulation.close()
+    Environment.close()
+    if TrafficGen is not None:
+        TrafficGen.close()
 
     print("\n----- Start time:", timestamp_start)
     print("----- End time:", datetime.datetime.now())
@@ -71,4 +162,5 @@ if __name__ == "__main__":
 
     Visualization.save_data_and_plot(data=Simulation.reward_store, filename='reward', xlabel='Episode', ylabel='Cumulative negative reward')
     Visualization.save_data_and_plot(data=Simulation.cumulative_wait_store, filename='delay', xlabel='Episode', ylabel='Cumulative delay (s)')
-    Visualization.save_data_and_plot(data=Simulation.avg_queue_length_store, filename='queue', xlabel='Episode', ylabel='Average queue length (vehicles)')
\ No newline at end of file
+    Visualization.save_data_and_plot(data=Simulation.avg_queue_length_store, filename='queue', xlabel='Episode', ylabel='Average queue length (vehicles)')
+    Visualization.save_records(data=Simulation.instrumentation_store, filename='instrumentation')
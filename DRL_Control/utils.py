@@ -19,13 +19,28 @@ def import_train_configuration(config_file):
     config['n_cars_generated'] = content['simulation'].getint('n_cars_generated')
     config['green_duration'] = content['simulation'].getint('green_duration')
     config['yellow_duration'] = content['simulation'].getint('yellow_duration')
+    config['num_workers'] = content['simulation'].getint('num_workers', fallback=1)
+    config['sumo_backend'] = content['simulation'].get('sumo_backend', fallback='traci')
+    config['trace_file'] = content['simulation'].get('trace_file', fallback='sumo_trace.pkl.gz')
+    config['warmup_steps'] = content['simulation'].getint('warmup_steps', fallback=0)
+    config['randomize_demand'] = content['simulation'].getboolean('randomize_demand', fallback=False)
+    config['demand_scale'] = content['simulation'].getfloat('demand_scale', fallback=1.0)
     config['num_layers'] = content['model'].getint('num_layers')
     config['width_layers'] = content['model'].getint('width_layers')
     config['batch_size'] = content['model'].getint('batch_size')
     config['learning_rate'] = content['model'].getfloat('learning_rate')
     config['training_epochs'] = content['model'].getint('training_epochs')
+    config['async_training'] = content['model'].getboolean('async_training', fallback=False)
+    config['sync_interval'] = content['model'].getint('sync_interval', fallback=50)
+    config['target_update'] = content['model'].get('target_update', fallback='none')
+    config['target_sync_interval'] = content['model'].getint('target_sync_interval', fallback=1000)
+    config['target_tau'] = content['model'].getfloat('target_tau', fallback=0.005)
+    config['double_dqn'] = content['model'].getboolean('double_dqn', fallback=False)
     config['memory_size_min'] = content['memory'].getint('memory_size_min')
     config['memory_size_max'] = content['memory'].getint('memory_size_max')
+    config['prioritized_replay'] = content['memory'].getboolean('prioritized_replay', fallback=False)
+    config['priority_alpha'] = content['memory'].getfloat('priority_alpha', fallback=0.6)
+    config['priority_beta'] = content['memory'].getfloat('priority_beta', fallback=0.4)
     config['num_states'] = content['agent'].getint('num_states')
     config['num_actions'] = content['agent'].getint('num_actions')
     config['gamma'] = content['agent'].getfloat('gamma')
@@ -47,8 +62,13 @@ def import_test_configuration(config_file):
     config['episode_seed'] = content['simulation'].getint('episode_seed')
     config['green_duration'] = content['simulation'].getint('green_duration')
     config['yellow_duration'] = content['simulation'].getint('yellow_duration')
+    config['sumo_backend'] = content['simulation'].get('sumo_backend', fallback='traci')
+    config['trace_file'] = content['simulation'].get('trace_file', fallback='sumo_trace.pkl.gz')
     config['num_states'] = content['agent'].getint('num_states')
     config['num_actions'] = content['agent'].getint('num_actions')
+    config['inference_backend'] = content['agent'].get('inference_backend', fallback='keras')
+    config['inference_precision'] = content['agent'].get('inference_precision', fallback='int8')
+    config['controller'] = content['agent'].get('controller', fallback='single')
     config['sumocfg_file_name'] = content['dir']['sumocfg_file_name']
     config['models_path_name'] = content['dir']['models_path_name']
     config['model_to_test'] = content['dir'].getint('model_to_test') 
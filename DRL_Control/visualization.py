@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
 import os
+import json
 
 class Visualization:
     def __init__(self, path, dpi):
@@ -29,4 +30,12 @@ class Visualization:
         with open(os.path.join(self._path, 'plot_'+filename + '_data.txt'), "w") as file:
             for value in data:
                     file.write("%s\n" % value)
-    
\ No newline at end of file
+
+
+    def save_records(self, data, filename):
+        """
+        Save records of the session to txt, one json object per line, without a plot
+        """
+        with open(os.path.join(self._path, filename + '_data.txt'), "w") as file:
+            for record in data:
+                file.write(json.dumps(record) + "\n")
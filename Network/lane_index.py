@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import sumolib
+
+NET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'foggybottommetro.net.xml')
+
+# incoming edges of the intersection by approach, the edges of the queue length of the training simulation
+APPROACHES = {
+    'south': ("-590598876#1",),
+    'I_street': ("50799230#0", "50799230#3"),
+    'north': ("1120094388#1", "130285156#1", "130285156#2"),
+}
+
+
+class LaneIndex:
+    def __init__(self, approaches=APPROACHES, net_file=NET_FILE, vehicle_class='passenger'):
+        """
+        Read the network once and list the lanes of every approach that the vehicle class can use, the sidewalks are left out
+        """
+        net = sumolib.net.readNet(net_file)
+        self._approaches = tuple(approaches)
+        self._lane_ids = []
+        approach_of_lane = []
+        for approach_number, edge_ids in enumerate(approaches.values()):
+            for edge_id in edge_ids:
+                for lane in net.getEdge(edge_id).getLanes():
+                    if lane.allows(vehicle_class):
+                        self._lane_ids.append(lane.getID())
+                        approach_of_lane.append(approach_number)
+        self._approach_of_lane = np.array(approach_of_lane)
+
+
+    def approach_totals(self, lane_values):
+        """
+        Sum a vector of lane values, in the order of lane_ids, by approach
+        """
+        return np.bincount(self._approach_of_lane, weights=lane_values, minlength=len(self._approaches))
+
+
+    @property
+    def lane_ids(self):
+        return self._lane_ids
+
+
+    @property
+    def approaches(self):
+        return self._approaches
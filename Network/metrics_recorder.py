@@ -0,0 +1,138 @@
+import os
+import sys
+import csv
+import numpy as np
+
+# the sumo backend of the DRL simulations: traci, libsumo (LIBSUMO_AS_TRACI), or a recorded trace
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'DRL_Control'))
+from sumo_backend import traci
+from traci import constants as tc
+
+# vehicle variables summed over the vehicles in the simulation at every step, and the column of each one
+VEHICLE_VARIABLES = {
+    tc.VAR_WAITING_TIME: 'waiting_time',
+    tc.VAR_ACCUMULATED_WAITING_TIME: 'travel_time',
+    tc.VAR_STOPSTATE: 'stops',
+    tc.VAR_FUELCONSUMPTION: 'fuel_consumption',
+    tc.VAR_COEMISSION: 'CO_emission',
+    tc.VAR_CO2EMISSION: 'CO2_emission',
+    tc.VAR_HCEMISSION: 'HC_emission',
+    tc.VAR_NOXEMISSION: 'NOx_emission',
+    tc.VAR_PMXEMISSION: 'PMx_emission',
+}
+
+# walking areas of the intersection, where the pedestrians waiting to cross are counted
+WALKING_AREAS = {
+    'c14': ':cluster_49793670_9123357154_9123357155_9428447085_w0',
+    'c2': ':cluster_49793670_9123357154_9123357155_9428447085_w2',
+    'c3': ':cluster_49793670_9123357154_9123357155_9428447085_w1',
+}
+
+COLUMNS = ('vehicle_count',) + tuple(VEHICLE_VARIABLES.values()) + ('queue_length',) + tuple(WALKING_AREAS)
+
+
+class MetricsRecorder:
+    def __init__(self, num_steps, Lanes):
+        self._num_steps = num_steps
+        self._Lanes = Lanes  # lane index of the intersection approaches, the queue length is measured on them only
+        self._queue_columns = tuple('queue_' + approach for approach in Lanes.approaches)
+        self._variables = tuple(VEHICLE_VARIABLES)
+        self._columns = {}
+        self._vehicles_seen = 0
+        self._steps = 0
+
+
+    def reset(self):
+        """
+        Subscribe to the vehicles, approach lanes and walking areas right after sumo is started, and clear the columns
+        """
+        self._columns = {column: np.zeros(self._num_steps) for column in COLUMNS + self._queue_columns}
+        self._vehicles_seen = 0
+        self._steps = 0
+        traci.simulation.subscribe((tc.VAR_DEPARTED_VEHICLES_IDS,))
+        for vehicle_id in traci.vehicle.getIDList():
+            traci.vehicle.subscribe(vehicle_id, self._variables)
+            self._vehicles_seen += 1
+        for lane_id in self._Lanes.lane_ids:
+            traci.lane.subscribe(lane_id, (tc.LAST_STEP_VEHICLE_HALTING_NUMBER,))
+        for walking_area in WALKING_AREAS.values():
+            traci.edge.subscribe(walking_area, (tc.LAST_STEP_PERSON_ID_LIST,))
+
+
+    def record(self):
+        """
+        Store the metrics of the last simulation step in the next row of the columns, to be called after every step
+        """
+        departed = traci.simulation.getSubscriptionResults()[tc.VAR_DEPARTED_VEHICLES_IDS]
+        for vehicle_id in departed:
+            traci.vehicle.subscribe(vehicle_id, self._variables)  # the values of the step are received with the subscription
+        self._vehicles_seen += len(departed)
+
+        row = self._steps
+        vehicles = traci.vehicle.getAllSubscriptionResults()
+        self._columns['vehicle_count'][row] = len(vehicles)
+        if vehicles:
+            sums = np.array([[values[variable] for variable in self._variables] for values in vehicles.values()]).sum(axis=0)
+            for column, value in zip(VEHICLE_VARIABLES.values(), sums):
+                self._columns[column][row] = value
+        lanes = traci.lane.getAllSubscriptionResults()
+        halting = np.fromiter((lanes[lane_id][tc.LAST_STEP_VEHICLE_HALTING_NUMBER] for lane_id in self._Lanes.lane_ids), float, len(self._Lanes.lane_ids))
+        queues = self._Lanes.approach_totals(halting)
+        for column, queue_length in zip(self._queue_columns, queues):
+            self._columns[column][row] = queue_length
+        self._columns['queue_length'][row] = queues.sum()
+        for group, walking_area in WALKING_AREAS.items():
+            self._columns[group][row] = len(traci.edge.getSubscriptionResults(walking_area)[tc.LAST_STEP_PERSON_ID_LIST])
+        self._steps += 1
+
+
+    def save(self, file_path):
+        """
+        Write the columns of the recorded steps, as parquet if the file name asks for it and pandas can write it, as npz otherwise
+        """
+        columns = {column: values[:self._steps] for column, values in self._columns.items()}
+        if file_path.endswith('.parquet'):
+            try:
+                import pandas as pd
+                pd.DataFrame(columns).to_parquet(file_path)
+                return file_path
+            except ImportError:
+                file_path = os.path.splitext(file_path)[0] + '.npz'
+        np.savez(file_path, **columns)
+        return file_path
+
+
+    def write_csv(self, output_file, output_interval):
+        """
+        Write the running totals every output_interval steps, with the current and maximum queue lengths
+        """
+        totals = {column: np.cumsum(self._columns[column][:self._steps]) for column in VEHICLE_VARIABLES.values()}
+        queue_length = self._columns['queue_length'][:self._steps]
+        max_queue_length = np.maximum.accumulate(queue_length)
+        with open(output_file, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['step', 'total_waiting_time', 'total_travel_time', 'total_stops', 'total_fuel_consumption',
+                             'CO_emission', 'CO2_emission', 'HC_emission', 'NOx_emission', 'PMx_emission',
+                             'current_queue_length', 'max_queue_length'])
+            for row in range(output_interval - 1, self._steps, output_interval):
+                writer.writerow([row + 1] + [totals[column][row] for column in VEHICLE_VARIABLES.values()] + [queue_length[row], max_queue_length[row]])
+
+
+    def summary(self, step_limit):
+        """
+        Compute the metrics of the whole run
+        """
+        steps = self._steps
+        vehicle_count = int(self._columns['vehicle_count'][:steps].sum())
+        totals = {column: float(self._columns[column][:steps].sum()) for column in VEHICLE_VARIABLES.values()}
+        queue_length = self._columns['queue_length'][:steps]
+        return {
+            "Average Waiting Time": totals['waiting_time'] / vehicle_count if vehicle_count else 0,
+            "Average Travel Time": totals['travel_time'] / vehicle_count if vehicle_count else 0,
+            "Average Queue Length": float(queue_length.mean()) if steps else 0,
+            "Maximum Queue Length": int(queue_length.max()) if steps else 0,
+            "Average Queue Length per Approach": {column[len('queue_'):]: float(self._columns[column][:steps].mean()) if steps else 0 for column in self._queue_columns},
+            "Throughput (vehicles per hour)": self._vehicles_seen / (step_limit / 3600),
+            "Total Fuel Consumption": totals['fuel_consumption'],
+            "Total Emissions": {name: totals[name + '_emission'] for name in ("CO", "CO2", "HC", "NOx", "PMx")},
+        }
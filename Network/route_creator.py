@@ -1,5 +1,7 @@
 import xml.etree.ElementTree as ET
 import xml.dom.minidom
+from xml.sax.saxutils import quoteattr
+import heapq
 import random
 
 def create_vehicle_types():
@@ -32,20 +34,17 @@ def create_pedestrian_types():
         elements.append(p)
     return elements
 
-def create_passenger_trips(trips, distribution, total_duration=3600):
+def create_passenger_trips(trips, distribution, total_duration=3600, rng=random):
     routes = []
     vehicle_types = create_vehicle_types()
     vehicle_type_ids = [v.get('id') for v in vehicle_types]
 
-    all_depart_times = []
-    for trip_name, count in distribution.items():
-        interval = total_duration / count
-        for i in range(count):
-            all_depart_times.append((trip_name, i * interval))
+    all_depart_times = [departure for trip_name, count in distribution.items()
+                        for departure in _passenger_departures(trip_name, count, total_duration)]
 
-    random.shuffle(all_depart_times)
+    rng.shuffle(all_depart_times)
 
-    for idx, (trip_name, depart_time) in enumerate(all_depart_times):
+    for idx, (depart_time, trip_name) in enumerate(all_depart_times):
         trip_details = trips[trip_name]
         vehicle_type = vehicle_type_ids[idx % len(vehicle_type_ids)]
         trip = ET.Element('vehicle', id=f"{trip_details['id']}_{idx}", type=vehicle_type, 
@@ -57,24 +56,18 @@ def create_passenger_trips(trips, distribution, total_duration=3600):
     routes.sort(key=lambda x: x[0])
     return vehicle_types + [trip for _, trip in routes]
 
-def create_pedestrian_trips(trips, distribution, total_duration=3600):
+def create_pedestrian_trips(trips, distribution, total_duration=3600, rng=random):
     routes = []
     pedestrian_types = create_pedestrian_types()
     pedestrian_type_ids = [p.get('id') for p in pedestrian_types]
 
-    all_depart_times = []
     interval_duration = 900  # 15 minutes in seconds
-    num_intervals = total_duration // interval_duration
+    all_depart_times = [departure for ped_id, counts in distribution.items()
+                        for departure in _pedestrian_departures(ped_id, counts, interval_duration)]
 
-    for ped_id, counts in distribution.items():
-        for interval_idx, count in enumerate(counts):
-            for i in range(count):
-                depart_time = interval_idx * interval_duration + (i * interval_duration / count)
-                all_depart_times.append((ped_id, depart_time))
+    rng.shuffle(all_depart_times)
 
-    random.shuffle(all_depart_times)
-
-    for idx, (ped_id, depart_time) in enumerate(all_depart_times):
+    for idx, (depart_time, ped_id) in enumerate(all_depart_times):
         trip_details = trips[ped_id]
         pedestrian_type = pedestrian_type_ids[idx % len(pedestrian_type_ids)]
         person = ET.Element('person', id=f"{ped_id}_{idx+1}", type=pedestrian_type, depart=str(depart_time))
@@ -86,6 +79,67 @@ def create_pedestrian_trips(trips, distribution, total_duration=3600):
     routes.sort(key=lambda x: x[0])
     return pedestrian_types + [person for _, person in routes]
 
+def _departures(name, depart_times):
+    for depart_time in depart_times:
+        yield depart_time, name
+
+def _passenger_departures(trip_name, count, total_duration):
+    interval = total_duration / count
+    return _departures(trip_name, (i * interval for i in range(count)))
+
+def _pedestrian_departures(ped_id, counts, interval_duration):
+    return _departures(ped_id, (interval_idx * interval_duration + (i * interval_duration / count)
+                                for interval_idx, count in enumerate(counts) for i in range(count)))
+
+def _type_ids(type_ids, rng):
+    # the types of every run of len(type_ids) trips are shuffled, each type is used as often as with the shuffled departures of create_*_trips
+    type_ids = list(type_ids)
+    while True:
+        rng.shuffle(type_ids)
+        yield from type_ids
+
+def _xml_attributes(attributes):
+    return "".join(f" {name}={quoteattr(str(value))}" for name, value in attributes)
+
+def stream_passenger_trips(trips, distribution, total_duration=3600, rng=random):
+    # the departures of every trip are already in order, a k-way merge orders them all without holding them in memory
+    vehicle_type_ids = _type_ids((v.get('id') for v in create_vehicle_types()), rng)
+    departures = heapq.merge(*(_passenger_departures(trip_name, count, total_duration) for trip_name, count in distribution.items()))
+    for idx, ((depart_time, trip_name), vehicle_type) in enumerate(zip(departures, vehicle_type_ids)):
+        trip_details = trips[trip_name]
+        attributes = _xml_attributes((("id", f"{trip_details['id']}_{idx}"), ("type", vehicle_type),
+                                      ("depart", depart_time), ("departLane", trip_details['departLane']),
+                                      ("departSpeed", trip_details['departSpeed'])))
+        yield depart_time, (f"   <vehicle{attributes}>\n"
+                            f"      <route edges={quoteattr(trip_details['route'])}/>\n"
+                            f"   </vehicle>\n")
+
+def stream_pedestrian_trips(trips, distribution, total_duration=3600, rng=random):
+    pedestrian_type_ids = _type_ids((p.get('id') for p in create_pedestrian_types()), rng)
+    interval_duration = 900  # 15 minutes in seconds
+    departures = heapq.merge(*(_pedestrian_departures(ped_id, counts, interval_duration) for ped_id, counts in distribution.items()))
+    for idx, ((depart_time, ped_id), pedestrian_type) in enumerate(zip(departures, pedestrian_type_ids)):
+        trip_details = trips[ped_id]
+        attributes = _xml_attributes((("id", f"{ped_id}_{idx+1}"), ("type", pedestrian_type),
+                                      ("depart", depart_time)))
+        yield depart_time, (f"   <person{attributes}>\n"
+                            f"      <walk from={quoteattr(trip_details['from'])} to={quoteattr(trip_details['to'])}/>\n"
+                            f"   </person>\n")
+
+def write_routes_stream(types, *trip_streams, file_path):
+    # the entries of several streams are merged by depart time and written as they come, in the format of save_routes_to_file
+    try:
+        with open(file_path, "w") as f:
+            f.write('<?xml version="1.0" ?>\n<routes>\n')
+            for element in types:
+                f.write(f"   <{element.tag}{_xml_attributes(element.attrib.items())}/>\n")
+            f.writelines(entry for _, entry in heapq.merge(*trip_streams, key=lambda trip: trip[0]))
+            f.write('</routes>\n')
+        print(f"Routing file '{file_path}' generated successfully.")
+    except PermissionError as e:
+        print(f"PermissionError: {e}")
+        print(f"Failed to save routing file '{file_path}'. Please check your permissions or try a different directory.")
+
 def save_routes_to_file(routes, file_path):
     root = ET.Element('routes')
     for element in routes:
@@ -142,8 +196,8 @@ pedestrian_distribution = {
     "ped6": [31, 21, 24, 23],
 }
 
-passenger_routes = create_passenger_trips(passenger_trips, vehicle_distribution)
-pedestrian_routes = create_pedestrian_trips(pedestrian_trips, pedestrian_distribution)
-
-save_routes_to_file(passenger_routes, r"C:\Users\Pedram\Desktop\GWU_UZilina_Colab\Network\foggy.vehicle.trips.xml")
-save_routes_to_file(pedestrian_routes, r"C:\Users\Pedram\Desktop\GWU_UZilina_Colab\Network\foggy.pedestrian.rou.xml")
+if __name__ == "__main__":
+    write_routes_stream(create_vehicle_types(), stream_passenger_trips(passenger_trips, vehicle_distribution),
+                        file_path=r"C:\Users\Pedram\Desktop\GWU_UZilina_Colab\Network\foggy.vehicle.trips.xml")
+    write_routes_stream(create_pedestrian_types(), stream_pedestrian_trips(pedestrian_trips, pedestrian_distribution),
+                        file_path=r"C:\Users\Pedram\Desktop\GWU_UZilina_Colab\Network\foggy.pedestrian.rou.xml")